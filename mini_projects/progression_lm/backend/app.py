@@ -4,28 +4,62 @@ A RAG-powered notebook chat application with PDF and web search capabilities.
 """
 
 import os
+import json
 import uuid
 import time
+import random
+import hashlib
+import shutil
+import asyncio
 import sqlite3
+import functools
+import multiprocessing
+import itertools
+import threading
+import re
+import struct
+import sys
+import argparse
+import base64
+import bisect
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, closing, contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Callable, Awaitable, Iterable, Iterator, AsyncIterator, Union, BinaryIO, TYPE_CHECKING
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from starlette.datastructures import Headers
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_tavily import TavilySearch
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.vectorstores import VectorStore
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
 
-import pymupdf4llm
+import numpy as np
+
+if TYPE_CHECKING:
+    # faiss and the LangChain FAISS store are imported on first use: notebooks in the memory-mapped
+    # format, and a worker's startup, never need them
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are serialized within one worker process only
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
@@ -34,35 +68,302 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "0.35"))
+RELEVANCE_GATE = os.getenv("RELEVANCE_GATE", "score").lower()  # 'score' or 'llm'
+RELEVANCE_LLM_FALLBACK = os.getenv("RELEVANCE_LLM_FALLBACK", "false").lower() == "true"
+RELEVANCE_BORDER_MARGIN = float(os.getenv("RELEVANCE_BORDER_MARGIN", "0.05"))
+RETRIEVAL_K = 5
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # max tokens of PDF context per prompt
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()  # 'hybrid' (BM25 + vectors) or 'dense'
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_SHORTCUT = os.getenv("LEXICAL_SHORTCUT", "true").lower() == "true"
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "false").lower() == "true"
+# Batch queries: questions per request and LLM calls / web searches in flight per batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Semantic answer cache: questions within this cosine similarity of a cached one reuse its answer
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+# Web search cache: Tavily results per normalized question, on disk and shared by all workers;
+# failed searches are cached for a short time so an outage is not retried by every query
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() == "true"
+WEB_CACHE_TTL_SECONDS = float(os.getenv("WEB_CACHE_TTL_SECONDS", "21600"))
+WEB_CACHE_FAILURE_TTL_SECONDS = float(os.getenv("WEB_CACHE_FAILURE_TTL_SECONDS", "60"))
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "10000"))
 MAX_PDF_SOURCES = int(os.getenv("MAX_PDF_SOURCES", "5"))
 MAX_WEB_SOURCES = int(os.getenv("MAX_WEB_SOURCES", "3"))
 PORT = int(os.getenv("PORT", "8000"))
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,file://").split(",")
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", "256"))
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "1024"))
+# Multi-notebook queries: notebook ids accepted in one session_ids list (all_notebooks has no limit),
+# and notebooks loaded and searched at a time
+MULTI_QUERY_MAX_NOTEBOOKS = int(os.getenv("MULTI_QUERY_MAX_NOTEBOOKS", "1000"))
+MULTI_QUERY_BATCH_SIZE = int(os.getenv("MULTI_QUERY_BATCH_SIZE", "16"))
+WARMUP_NOTEBOOKS = int(os.getenv("WARMUP_NOTEBOOKS", "8"))  # most recently used notebooks loaded at startup
+INDEX_FORMAT = os.getenv("INDEX_FORMAT", "faiss").lower()  # 'faiss' or 'mmap', for new notebooks
+INDEX_MMAP_DTYPE = os.getenv("INDEX_MMAP_DTYPE", "float32").lower()  # 'float32' or 'float16'
+INDEX_MODE = os.getenv("INDEX_MODE", "flat").lower()  # 'flat', 'fp16', 'sq8', or 'ivfpq' (FAISS format)
+IVF_MIN_CHUNKS = int(os.getenv("IVF_MIN_CHUNKS", "10000"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "64"))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None  # None = full model dimensions
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+# Multi-process serving: uvicorn worker processes (WEB_CONCURRENCY, read by uvicorn and gunicorn too), and
+# whether FAISS-format indexes are memory-mapped read-only so the workers share one copy of their vectors
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_INDEXES = os.getenv("SHARED_INDEXES", "true" if WORKERS > 1 else "false").lower() == "true"
+# Metadata database: pooled connections (all database calls run on the blocking pool) and how long
+# a writer waits for the write lock before failing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(BLOCKING_WORKERS)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+NOTEBOOKS_PAGE_SIZE = int(os.getenv("NOTEBOOKS_PAGE_SIZE", "100"))
+NOTEBOOKS_MAX_PAGE_SIZE = 500
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+PARSE_BATCH_PAGES = int(os.getenv("PARSE_BATCH_PAGES", "8"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 = parse in threads
+PIPELINE_EMBED_CHUNKS = int(os.getenv("PIPELINE_EMBED_CHUNKS", "256"))
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL") or None
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "512"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
 
 # Paths
 DATA_DIR = Path("data")
 PDFS_DIR = DATA_DIR / "pdfs"
 INDEX_DIR = DATA_DIR / "index"
 DB_PATH = DATA_DIR / "db.sqlite"
+WORKERS_DIR = DATA_DIR / "workers"  # one lock file per running server process (see claim_worker)
+EMBEDDING_CACHE_PATH = DATA_DIR / "embeddings.sqlite"
+WEB_CACHE_PATH = DATA_DIR / "web_cache.sqlite"
 FRONTEND_DIR = Path("../frontend")
 FRONTEND_HTML = FRONTEND_DIR / "index.html"
 
-# Create directories
-DATA_DIR.mkdir(exist_ok=True)
-PDFS_DIR.mkdir(exist_ok=True)
-INDEX_DIR.mkdir(exist_ok=True)
+# Metrics
+# Per-process latency histograms and counters, served in the Prometheus text format on /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items()) + "}"
+
+def prometheus_family(
+    name: str,
+    kind: str,
+    help_text: str,
+    samples: Iterable[tuple[Dict[str, Any], float]]
+) -> List[str]:
+    """Text-format lines of one counter or gauge: HELP, TYPE and a sample per label set"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{prometheus_labels(labels)} {float(value)!r}" for labels, value in samples)
+    return lines
+
+class Metrics:
+    """
+    Counters and latency histograms keyed by label values, declared once with define().
+    Recorded from the event loop and from blocking-pool threads, so updates take a lock.
+    """
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._families: Dict[str, tuple[str, str]] = {}  # name -> (kind, help text)
+        # name -> label items -> value (counters) or per-bucket counts, +Inf count and sum (histograms)
+        self._series: Dict[str, Dict[tuple, Any]] = {}
+
+    def define(self, name: str, kind: str, help_text: str):
+        self._families[name] = (kind, help_text)
+        self._series[name] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            counts = self._series[name].get(key)
+            if counts is None:
+                counts = self._series[name][key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            counts[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        with self._lock:
+            for name, (kind, help_text) in self._families.items():
+                series = self._series[name]
+                if kind == "counter":
+                    lines.extend(prometheus_family(name, kind, help_text, ((dict(key), value) for key, value in series.items())))
+                    continue
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for key, counts in series.items():
+                    labels = dict(key)
+                    cumulative = 0
+                    for bound, count in zip(bounds, counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{prometheus_labels(labels)} {counts[-1]!r}")
+                    lines.append(f"{name}_count{prometheus_labels(labels)} {cumulative}")
+        return lines
+
+metrics = Metrics(LATENCY_BUCKETS)
+metrics.define("progression_stage_seconds", "histogram", "Time spent in each pipeline stage")
+metrics.define("progression_query_seconds", "histogram", "Single-query latency until the answer is complete, by answer source")
+metrics.define("progression_ingest_seconds", "histogram", "Ingestion job duration, by final status")
+metrics.define("progression_llm_tokens_total", "counter", "LLM tokens, by model and prompt/completion")
+metrics.define("progression_embedding_tokens_total", "counter", "Embedded tokens, by purpose (ingest or query)")
+
+class RequestTrace:
+    """Seconds per stage and LLM tokens of one request or ingestion job; a repeated or concurrent stage adds up"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages: Dict[str, float] = {}
+        self.llm_tokens = {"prompt": 0, "completion": 0}
+
+    def add_stage(self, stage_name: str, seconds: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "stages": {stage_name: round(seconds, 4) for stage_name, seconds in self.stages.items()},
+            "llm_tokens": dict(self.llm_tokens),
+        }
+
+# The trace of the request or job the current task works on. Tasks copy it when they are created, so
+# background tasks of a request (speculative search, embedding groups) record into the same trace.
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+def start_trace(operation: str) -> RequestTrace:
+    """Start tracing in the current task; each request runs in its own task, so the trace ends with it"""
+    trace = RequestTrace(operation)
+    current_trace.set(trace)
+    return trace
+
+@contextmanager
+def stage(stage_name: str):
+    """Time a pipeline stage into the stage histogram and the current trace"""
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(
+            "progression_stage_seconds", seconds,
+            operation=trace.operation if trace else "other", stage=stage_name
+        )
+        if trace is not None:
+            trace.add_stage(stage_name, seconds)
+
+class LlmUsageRecorder(AsyncCallbackHandler):
+    """Counts the prompt and completion tokens each LLM call reports"""
+
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        trace = current_trace.get()
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                model = message.response_metadata.get("model_name", "unknown")
+                for kind, count in (("prompt", usage["input_tokens"]), ("completion", usage["output_tokens"])):
+                    metrics.inc("progression_llm_tokens_total", count, model=model, type=kind)
+                    if trace is not None:
+                        trace.llm_tokens[kind] += count
+
+# API clients
+# Created on first use or by the startup warm-up, not at import: langchain_openai and langchain_tavily
+# take seconds to import, and parse workers and scripts importing the app never need them.
+# Benchmarks and tests may assign their own objects to these names beforehand.
+embedding_model: Optional[Embeddings] = None
+llm: Optional[BaseChatModel] = None
+tavily_search: Optional[Any] = None
+clients_lock = threading.Lock()
+
+def get_embedding_model() -> Embeddings:
+    global embedding_model
+    if embedding_model is None:
+        with clients_lock:
+            if embedding_model is None:
+                from langchain_openai import OpenAIEmbeddings
+                embedding_model = OpenAIEmbeddings(model=EMBEDDING_MODEL, base_url=EMBEDDING_BASE_URL)
+    return embedding_model
+
+def get_llm() -> BaseChatModel:
+    global llm
+    if llm is None:
+        with clients_lock:
+            if llm is None:
+                from langchain_openai import ChatOpenAI
+                # stream_usage: streamed answers report their token counts too
+                llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, stream_usage=True, callbacks=[LlmUsageRecorder()])
+    return llm
 
-# Initialize models
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-large")
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-tavily_search = TavilySearch(max_results=MAX_WEB_SOURCES, topic="general")
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+def get_tavily_search() -> Any:
+    global tavily_search
+    if tavily_search is None:
+        with clients_lock:
+            if tavily_search is None:
+                from langchain_tavily import TavilySearch
+                tavily_search = TavilySearch(max_results=MAX_WEB_SOURCES, topic="general")
+    return tavily_search
+
+def create_clients():
+    get_embedding_model()
+    get_llm()
+    get_tavily_search()
+# start_index (offset in the page text) lets the context builder join adjacent chunks
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+
+# Bounded pool for blocking work (PDF parsing, disk I/O, sqlite) so the event loop stays free
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking or CPU-bound call on the bounded executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
+
+# Process pool for PDF parsing, started on first use so importing the app (and each worker) stays cheap
+parse_executor: Optional[ProcessPoolExecutor] = None
+
+def get_parse_executor() -> Executor:
+    """Executor that parses PDF page ranges; PARSE_WORKERS=0 falls back to the blocking thread pool"""
+    global parse_executor
+    if PARSE_WORKERS <= 0:
+        return blocking_executor
+    if parse_executor is None:
+        # spawn, not fork: forking a process that runs threads and an event loop can deadlock children
+        parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return parse_executor
 
 # Pydantic Models
 class PdfSource(BaseModel):
     file_name: str
     page_start: Optional[int] = None
     page_end: Optional[int] = None
+    notebook_id: Optional[str] = None  # set for multi-notebook queries
+    notebook_name: Optional[str] = None
 
 class WebSource(BaseModel):
     title: str
@@ -70,9 +371,18 @@ class WebSource(BaseModel):
     snippet: str
 
 class QueryRequest(BaseModel):
-    session_id: str
+    session_id: Optional[str] = None
+    session_ids: Optional[List[str]] = None  # multi-notebook mode: search these notebooks
+    all_notebooks: bool = False  # multi-notebook mode: search every ready notebook
     question: str
     stream: bool = False
+    speculative: Optional[bool] = None  # None = SPECULATIVE_WEB_SEARCH default
+    cache: bool = True  # False skips the answer cache lookup for this request
+
+class BatchQueryRequest(BaseModel):
+    session_id: str
+    questions: List[str]
+    max_concurrency: Optional[int] = None  # None = BATCH_CONCURRENCY, which is also the upper bound
 
 class QueryResponse(BaseModel):
     success: bool = True
@@ -86,59 +396,1478 @@ class QueryResponse(BaseModel):
 
 class UploadResponse(BaseModel):
     success: bool = True
-    message: str = "Uploaded successfully"
+    message: str = "Upload accepted, indexing started"
     session_id: str
+    job_id: str
     filename: str
-    num_chunks: int
+    status: str = "indexing"
+    num_chunks: Optional[int] = None
     processing_time: float
 
+class IngestJob(BaseModel):
+    job_id: str
+    session_id: str
+    filename: str
+    append: bool = False  # adding a source to an existing notebook
+    status: str = "queued"  # 'queued', 'parsing', 'embedding', 'ready', or 'failed'
+    pages_parsed: int = 0
+    pages_total: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_total: Optional[int] = None
+    chunks_cached: int = 0
+    embed_chunks_per_second: Optional[float] = None
+    content_sha256: Optional[str] = None
+    deduplicated_from: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str
+    processing_time: Optional[float] = None
+    stages: Dict[str, float] = {}  # seconds per stage (pdf_parse, embedding, index_write, ...) once finished
+
+class NotebookSource(BaseModel):
+    file_name: str
+    content_sha256: str
+    num_chunks: Optional[int] = None
+    added_at: str
+
 class Notebook(BaseModel):
     id: str
     name: str
     created_at: str
     sources_count: int
+    status: str = "ready"  # 'indexing', 'ready', or 'failed'
+
+# Vector index modes
+class TruncatedEmbeddings(Embeddings):
+    """
+    Embeddings shortened to their first dims components and re-normalized to unit length.
+    text-embedding-3 models are trained for this, so it matches asking the API for fewer dimensions,
+    while the embedding cache keeps full vectors and any index dimension can be queried.
+    """
+
+    def __init__(self, base: Embeddings, dims: int):
+        self.base = base
+        self.dims = dims
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return truncate_embeddings(self.base.embed_documents(texts), self.dims).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return truncate_embeddings([self.base.embed_query(text)], self.dims)[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return truncate_embeddings(await self.base.aembed_documents(texts), self.dims).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return truncate_embeddings([await self.base.aembed_query(text)], self.dims)[0].tolist()
+
+class UnavailableEmbeddings(Embeddings):
+    """
+    Placeholder for stores that are only read and rewritten, never queried, so offline tools such as
+    migrate-index run without an API key
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError("This vector store was opened without an embedding model")
+
+    def embed_query(self, text: str) -> List[float]:
+        raise RuntimeError("This vector store was opened without an embedding model")
+
+def truncate_embeddings(embeddings: List[List[float]], dims: Optional[int]) -> np.ndarray:
+    """Embeddings as a float32 matrix, cut to dims and re-normalized when they are longer"""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if dims is None or vectors.shape[1] <= dims:
+        return vectors
+    vectors = np.ascontiguousarray(vectors[:, :dims])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def faiss_index_spec(num_vectors: int, dims: int, mode: Optional[str] = None) -> str:
+    """faiss.index_factory description for a notebook of num_vectors chunks in the given INDEX_MODE"""
+    mode = mode or INDEX_MODE
+    if mode == "fp16":
+        return "SQfp16"
+    if mode == "sq8":
+        return "SQ8"
+    # IVF needs enough vectors to train its coarse centroids and 256 PQ codes per sub-quantizer
+    if mode == "ivfpq" and num_vectors >= max(IVF_MIN_CHUNKS, 256):
+        nlist = max(1, min(int(4 * num_vectors ** 0.5), num_vectors // 39))
+        m = max(m for m in range(1, min(PQ_M, dims) + 1) if dims % m == 0)
+        return f"IVF{nlist},PQ{m}"
+    return "Flat"
+
+def build_faiss_index(vectors: np.ndarray, mode: Optional[str] = None) -> "faiss.Index":
+    """Empty FAISS index for the vectors in the configured mode, trained on them when the mode needs it"""
+    import faiss
+    index = faiss.index_factory(vectors.shape[1], faiss_index_spec(len(vectors), vectors.shape[1], mode), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    configure_faiss_index(index)
+    return index
+
+def configure_faiss_index(index: "faiss.Index"):
+    """Apply search-time settings (IVF_NPROBE) to a built or loaded index"""
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+
+# Memory-mapped index format
+# vectors.bin: 64-byte header (magic, format version, dtype, dimensions, row count, generation)
+# followed by a row-major float32/float16 matrix; chunks.sqlite: chunk id, text and metadata per row.
+MMAP_MAGIC = b"PLMVEC\x00\x01"
+MMAP_FORMAT_VERSION = 1
+MMAP_HEADER = struct.Struct("<8sIIIQQ")
+MMAP_HEADER_SIZE = 64
+MMAP_DTYPES = {0: np.float32, 1: np.float16}
+MMAP_DTYPE_CODES = {"float32": 0, "float16": 1}
+MMAP_SEARCH_BLOCK_ROWS = 65536
+
+class MmapVectorStore(VectorStore):
+    """
+    Read-only notebook index stored as a memory-mapped vector file plus a SQLite chunk store.
+    Opening reads only the header, so cold loads are near-instant, and worker processes share
+    the vector pages through the OS page cache. Nothing is unpickled.
+    Updates write a new generation of both files and swap them in (see write_mmap_index). A store keeps
+    both files of its generation open, so it stays consistent while a newer generation replaces them.
+    """
+
+    def __init__(self, path: Path, embedding: Embeddings):
+        self.path = Path(path)
+        # Both files are opened before anything is validated: the mapping and the connection then
+        # belong to whichever generation the header and meta table name, even if a swap follows
+        with open(self.path / "vectors.bin", "rb") as vectors_file:
+            # Opened read-only and immutable (generations are never modified in place), shared by
+            # the blocking threads: sqlite3 connections are serialized internally
+            self._conn = sqlite3.connect(
+                f"file:{self.path / 'chunks.sqlite'}?mode=ro&immutable=1", uri=True, check_same_thread=False
+            )
+            header = read_mmap_header(self.path / "vectors.bin", vectors_file)
+            self.dim = header["dim"]
+            self.embedding = TruncatedEmbeddings(embedding, self.dim)
+            self.count = header["count"]
+            self.dtype = MMAP_DTYPES[header["dtype"]]
+            self.generation = header["generation"]
+
+            row_count, generation = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM chunks), (SELECT value FROM meta WHERE key = 'generation')"
+            ).fetchone()
+            if row_count != self.count or int(generation) != self.generation:
+                self._conn.close()
+                raise ValueError(f"Index files in {self.path} are from different generations")
+
+            if self.count:
+                # The mapping outlives the file object and keeps the opened inode's pages
+                self.vectors = np.memmap(
+                    vectors_file, dtype=self.dtype, mode="r",
+                    offset=MMAP_HEADER_SIZE, shape=(self.count, self.dim)
+                )
+            else:
+                self.vectors = np.zeros((0, self.dim), dtype=self.dtype)
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return cosine_relevance_score
+
+    def iter_documents(self) -> Iterator[Document]:
+        """All chunks in row order, with their chunk ids"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT id, text, metadata FROM chunks ORDER BY row")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for doc_id, text, metadata in rows:
+                yield Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+
+    def get_documents(self, rows: List[int]) -> List[Document]:
+        """Chunks for the given rows, in the order requested"""
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            found = {
+                row: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+                for row, doc_id, text, metadata in self._conn.execute(
+                    f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({placeholders})", rows
+                )
+            }
+        return [found[row] for row in rows]
+
+    def vector_blocks(self, mask: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+        """Stored vectors in row blocks (optionally only rows where mask is true), without loading them all"""
+        for start in range(0, self.count, MMAP_SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + MMAP_SEARCH_BLOCK_ROWS]
+            yield block if mask is None else block[mask[start:start + MMAP_SEARCH_BLOCK_ROWS]]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        """Exact inner-product search; scores are squared L2 distances like a FAISS flat index"""
+        k = min(k, self.count)
+        if k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.dtype == np.float32:
+            similarities = np.asarray(self.vectors @ query)
+        else:
+            similarities = np.concatenate([block.astype(np.float32) @ query for block in self.vector_blocks()])
+
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        documents = self.get_documents([int(row) for row in top])
+        # Unit vectors: |a - b|^2 = 2 - 2 * cos(a, b)
+        return [(doc, float(2.0 - 2.0 * similarities[row])) for doc, row in zip(documents, top)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        return await run_blocking(self.similarity_search_with_score_by_vector, embedding, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("Memory-mapped indexes are immutable; write a new generation instead")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Use write_mmap_index to create a memory-mapped index")
+
+def read_mmap_header(vectors_path: Path, vectors_file: Optional[BinaryIO] = None) -> Dict[str, int]:
+    """Parse and validate the header of a vectors.bin file, from vectors_file when it is already open"""
+    if vectors_file is None:
+        with open(vectors_path, "rb") as f:
+            return read_mmap_header(vectors_path, f)
+    vectors_file.seek(0)
+    raw = vectors_file.read(MMAP_HEADER_SIZE)
+    if len(raw) < MMAP_HEADER.size:
+        raise ValueError(f"{vectors_path} is truncated")
+    magic, version, dtype_code, dim, count, generation = MMAP_HEADER.unpack_from(raw)
+    if magic != MMAP_MAGIC:
+        raise ValueError(f"{vectors_path} is not a Progression LM vector file")
+    if version > MMAP_FORMAT_VERSION:
+        raise ValueError(f"{vectors_path} uses index format version {version}; this build reads up to {MMAP_FORMAT_VERSION}")
+    if dtype_code not in MMAP_DTYPES:
+        raise ValueError(f"{vectors_path} has unknown dtype code {dtype_code}")
+    expected_size = MMAP_HEADER_SIZE + count * dim * np.dtype(MMAP_DTYPES[dtype_code]).itemsize
+    if os.fstat(vectors_file.fileno()).st_size != expected_size:
+        raise ValueError(f"{vectors_path} is truncated")
+    return {"version": version, "dtype": dtype_code, "dim": dim, "count": count, "generation": generation}
+
+def write_mmap_index(
+    path: Path,
+    documents: List[Document],
+    vector_blocks: Iterable[np.ndarray],
+    dim: int,
+    dtype: str = "float32"
+):
+    """
+    Write both files of a memory-mapped index into an empty directory.
+    vector_blocks are written in order and must hold one row per document.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    generation = random.getrandbits(63)
+    count = 0
+    with open(path / "vectors.bin", "wb") as f:
+        # Header is rewritten with the final row count once all blocks are in
+        f.write(b"\0" * MMAP_HEADER_SIZE)
+        for block in vector_blocks:
+            block = np.ascontiguousarray(block, dtype=dtype).reshape(-1, dim)
+            block.tofile(f)
+            count += len(block)
+        f.seek(0)
+        f.write(MMAP_HEADER.pack(MMAP_MAGIC, MMAP_FORMAT_VERSION, MMAP_DTYPE_CODES[dtype], dim, count, generation))
+    if count != len(documents):
+        raise ValueError(f"Index has {count} vectors for {len(documents)} chunks")
+
+    with closing(sqlite3.connect(path / "chunks.sqlite")) as conn:
+        conn.execute("CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+            (
+                (row, doc.id or str(uuid.uuid4()), doc.page_content, json.dumps(doc.metadata))
+                for row, doc in enumerate(documents)
+            )
+        )
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("format_version", str(MMAP_FORMAT_VERSION)), ("generation", str(generation))]
+        )
+        conn.commit()
+
+@functools.lru_cache(maxsize=None)
+def mapped_faiss_class() -> type:
+    """The MappedFAISS store class, defined on first use so that LangChain's FAISS is imported lazily"""
+    from langchain_community.vectorstores import FAISS
+
+    class MappedFAISS(FAISS):
+        """
+        FAISS-format notebook loaded with SHARED_INDEXES: flat and scalar-quantized codes are memory-mapped
+        read-only from index.faiss, so worker processes share them through the OS page cache like the
+        memory-mapped format. The docstore is still unpickled per worker. The mapped index must never be
+        modified, not even through faiss.clone_index (clones stay views); copy_vectorstore makes owned copies.
+        """
+
+    return MappedFAISS
+
+# Vectorstore cache
+def estimate_vectorstore_bytes(vectorstore: VectorStore) -> int:
+    """Rough resident size of a loaded vectorstore: index codes plus docstore text"""
+    if isinstance(vectorstore, MmapVectorStore):
+        # Mapped vector pages belong to the shared page cache, and chunk text stays in SQLite
+        return 64 * 1024
+    import faiss
+    index = vectorstore.index
+    code_size = getattr(index, "code_size", index.d * 4)
+    # IVF inverted lists are not mapped; they are loaded into the worker like before
+    mapped = isinstance(vectorstore, mapped_faiss_class()) and isinstance(index, faiss.IndexFlatCodes)
+    size = 0 if mapped else index.ntotal * code_size
+    for doc in vectorstore.docstore._dict.values():
+        # Text plus a flat allowance for the metadata dict and Document object
+        size += len(doc.page_content) + 256
+    return size
+
+class VectorstoreCache:
+    """
+    Process-wide LRU cache of loaded vectorstores.
+    Bounded by entry count and by estimated memory; least recently used entries are evicted first.
+    Entries remember the index_version they were loaded from, so a notebook updated by another
+    worker process (or by migrate-index) is reloaded on its next lookup.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[VectorStore, int, Optional[tuple[int, int]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, session_id: str, version: Optional[tuple[int, int]]) -> Optional[VectorStore]:
+        """Cached vectorstore of the notebook, if it was loaded from the index files now on disk (version)"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[2] != version:
+                self._remove(session_id)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, session_id: str, vectorstore: VectorStore, version: Optional[tuple[int, int]], evict: bool = True):
+        """Cache a loaded vectorstore; with evict=False only if it fits without evicting another"""
+        size = estimate_vectorstore_bytes(vectorstore)
+        with self._lock:
+            self._remove(session_id)
+            # An index larger than the whole budget is served uncached
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            if not evict and (len(self._entries) >= self.max_entries or self.current_bytes + size > self.max_bytes):
+                return
+            self._entries[session_id] = (vectorstore, size, version)
+            self.current_bytes += size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            if self._remove(session_id):
+                self.invalidations += 1
+
+    def _remove(self, session_id: str) -> bool:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        self.current_bytes -= entry[1]
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+vectorstore_cache = VectorstoreCache(INDEX_CACHE_MAX_ENTRIES, INDEX_CACHE_MAX_MB * 1024 * 1024)
+
+# Answer cache
+def normalize_question(question: str) -> str:
+    """Question text as cache lookups compare it: lowercase, single spaces, no trailing ?, ! or ."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+class AnswerCache:
+    """
+    Process-wide semantic cache of query responses per notebook.
+    A question hits when a cached question of the same notebook is at least min_similarity cosine-similar,
+    names the same identifiers (so "error E41" never gets the answer for "error E42"), is younger than
+    ttl_seconds and was answered from the notebook's current index version.
+    Questions answered by the lexical shortcut are never embedded, so they are cached without a vector
+    and only hit by exact text.
+    Bounded by entry count; least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, min_similarity: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        # LRU order over all notebooks, plus each notebook's entries for lookups
+        self._lru: "OrderedDict[tuple[str, int], None]" = OrderedDict()
+        self._notebooks: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_exact(
+        self,
+        session_id: str,
+        question: str,
+        version: Any,
+        count_miss: bool = False
+    ) -> Optional[tuple[Dict[str, Any], float, float]]:
+        """A cached answer to the same question text (no embedding needed); misses count only with count_miss"""
+        normalized = normalize_question(question)
+        with self._lock:
+            entries = self._live_entries(session_id, version)
+            for key, entry in entries.items():
+                if entry["question"] == normalized:
+                    return self._hit(session_id, key, entry, 1.0)
+            if count_miss:
+                self.misses += 1
+        return None
+
+    def get_similar(
+        self,
+        session_id: str,
+        question: str,
+        vector: List[float],
+        version: Any
+    ) -> Optional[tuple[Dict[str, Any], float, float]]:
+        """The most similar cached answer within the radius; returns the response, similarity and age in seconds"""
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        identifiers = question_identifiers(question)
+        with self._lock:
+            entries = self._live_entries(session_id, version)
+            candidates = [
+                (key, entry) for key, entry in entries.items()
+                if entry["vector"] is not None and entry["identifiers"] == identifiers
+            ]
+            if candidates:
+                similarities = np.stack([entry["vector"] for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.min_similarity:
+                    key, entry = candidates[best]
+                    return self._hit(session_id, key, entry, float(similarities[best]))
+            self.misses += 1
+        return None
+
+    def put(self, session_id: str, question: str, vector: Optional[List[float]], version: Any, response: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        stored = None
+        if vector is not None:
+            stored = np.asarray(vector, dtype=np.float32)
+            stored = stored / (np.linalg.norm(stored) or 1.0)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            entries = self._live_entries(session_id, version)
+            entries[key] = {
+                "question": normalize_question(question),
+                "identifiers": question_identifiers(question),
+                "vector": stored,
+                "version": version,
+                "created": time.monotonic(),
+                "response": response,
+            }
+            self._notebooks[session_id] = entries
+            self._lru[(session_id, key)] = None
+            while len(self._lru) > self.max_entries:
+                evicted_session, evicted_key = self._lru.popitem(last=False)[0]
+                self._notebooks[evicted_session].pop(evicted_key, None)
+                if not self._notebooks[evicted_session]:
+                    del self._notebooks[evicted_session]
+                self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            if self._drop_notebook(session_id):
+                self.invalidations += 1
+
+    def _live_entries(self, session_id: str, version: Any) -> Dict[int, Dict[str, Any]]:
+        """The notebook's usable entries, dropping expired ones and all of them once the index changed"""
+        entries = self._notebooks.get(session_id, {})
+        if entries and next(iter(entries.values()))["version"] != version:
+            # Another worker (or this one) updated the notebook since these answers were cached
+            self._drop_notebook(session_id)
+            self.invalidations += 1
+            return {}
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if now - entry["created"] > self.ttl_seconds]:
+            del entries[key]
+            self._lru.pop((session_id, key), None)
+            self.expirations += 1
+        return entries
+
+    def _drop_notebook(self, session_id: str) -> bool:
+        entries = self._notebooks.pop(session_id, None)
+        if not entries:
+            return False
+        for key in entries:
+            self._lru.pop((session_id, key), None)
+        return True
+
+    def _hit(self, session_id: str, key: int, entry: Dict[str, Any], similarity: float):
+        self._lru.move_to_end((session_id, key))
+        self.hits += 1
+        return entry["response"], similarity, time.monotonic() - entry["created"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "entries": len(self._lru),
+                "notebooks": len(self._notebooks),
+                "max_entries": self.max_entries,
+                "similarity": self.min_similarity,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+
+# Embedding cache
+class EmbeddingCache:
+    """
+    Persistent embedding cache in SQLite, keyed by SHA-256 of model name and chunk text.
+    Vectors are stored as raw float32 bytes, so identical chunks are only embedded once.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def init(self):
+        """Create the cache table; run by init_storage"""
+        conn = sqlite3.connect(self.path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached vectors, returning None for texts that have not been embedded yet"""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        conn = sqlite3.connect(self.path)
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            found.update(rows)
+        conn.close()
+
+        vectors = []
+        for key in keys:
+            blob = found.get(key)
+            vectors.append(np.frombuffer(blob, dtype=np.float32).tolist() if blob is not None else None)
+        hits = sum(vector is not None for vector in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        conn = sqlite3.connect(self.path)
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [
+                (self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+                for text, vector in zip(texts, vectors)
+            ]
+        )
+        conn.commit()
+        conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+
+# Web search cache
+def web_query_key(question: str) -> bytes:
+    """Cache key of a web search; case, whitespace and trailing punctuation do not change the results"""
+    normalized = normalize_question(question)
+    return hashlib.sha256(f"{MAX_WEB_SOURCES}\0{normalized}".encode("utf-8")).digest()
+
+class WebSearchCache:
+    """
+    Persistent cache of web search results in SQLite, keyed by the normalized question and shared by all
+    worker processes. Results expire after ttl_seconds. Failed searches are stored as empty results that
+    expire after failure_ttl_seconds. Bounded by entry count; entries closest to expiry are evicted first.
+    """
+
+    def __init__(self, path: Path, max_entries: int, ttl_seconds: float, failure_ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.hits = 0
+        self.failure_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Upstream activity of this worker, counted by perform_web_search
+        self.searches = 0
+        self.failures = 0
+        self.coalesced = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+    def init(self):
+        """Create the cache table; run by init_storage"""
+        with closing(self._connect()) as conn:
+            # Several workers write results; WAL keeps their lookups from waiting on a write
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS web_results (
+                    key BLOB PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    failed INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_web_results_expires ON web_results (expires_at)")
+            conn.commit()
+
+    def get(self, key: bytes) -> Optional[List[Dict[str, str]]]:
+        """Cached results (empty after a recent failure), or None when there are none or they expired"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT results, failed FROM web_results WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[1]:
+            self.failure_hits += 1
+        else:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: bytes, results: List[Dict[str, str]], failed: bool):
+        ttl = self.failure_ttl_seconds if failed else self.ttl_seconds
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO web_results (key, results, failed, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(results), int(failed), now + ttl)
+            )
+            conn.execute("DELETE FROM web_results WHERE expires_at <= ?", (now,))
+            excess = conn.execute("SELECT COUNT(*) FROM web_results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM web_results WHERE key IN (SELECT key FROM web_results ORDER BY expires_at LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.failure_hits + self.misses
+        return {
+            "enabled": WEB_CACHE_ENABLED,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "failure_ttl_seconds": self.failure_ttl_seconds,
+            "hits": self.hits,
+            "failure_hits": self.failure_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "upstream_searches": self.searches,
+            "upstream_failures": self.failures,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.failure_hits) / lookups if lookups else 0.0,
+        }
+
+web_cache = WebSearchCache(WEB_CACHE_PATH, WEB_CACHE_MAX_ENTRIES, WEB_CACHE_TTL_SECONDS, WEB_CACHE_FAILURE_TTL_SECONDS)
+
+# Embedding scheduler
+_token_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, falling back to a ~4 characters/token estimate when unavailable"""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoding = False
+    if _token_encoding:
+        return len(_token_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+class RateLimiter:
+    """Token-bucket limiter for requests per minute and tokens per minute"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        """Wait until one request carrying the given number of tokens fits under both limits"""
+        # A single batch larger than the whole per-minute budget waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm
+                )
+                await asyncio.sleep(wait)
+
+@functools.lru_cache(maxsize=None)
+def retryable_embedding_errors() -> tuple:
+    """Embedding API errors worth retrying; openai is imported only once embedding starts"""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+class EmbeddingScheduler:
+    """
+    Embeds texts in token-budgeted batches, several batches in flight at once,
+    under shared requests-per-minute and tokens-per-minute limits with retry and backoff.
+    """
+
+    def __init__(
+        self,
+        batch_tokens: int,
+        batch_max_inputs: int,
+        concurrency: int,
+        rpm: int,
+        tpm: int,
+        max_retries: int
+    ):
+        self.batch_tokens = batch_tokens
+        self.batch_max_inputs = batch_max_inputs
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(rpm, tpm)
+        self.chunks_embedded = 0
+        self.tokens_embedded = 0
+        self.requests = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+        self.last_chunks_per_second: Optional[float] = None
+
+    def make_batches(self, texts: List[str]) -> List[tuple[List[str], int]]:
+        """Group texts into (batch, token count) pairs within the token and input budgets"""
+        batches = []
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= self.batch_max_inputs):
+                batches.append((batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((batch, batch_tokens))
+        return batches
+
+    async def _embed_batch(self, batch: List[str], tokens: int) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(tokens)
+            self.requests += 1
+            try:
+                return await get_embedding_model().aembed_documents(batch)
+            except retryable_embedding_errors() as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                # Exponential backoff with full jitter, capped at one minute
+                delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def embed(
+        self,
+        texts: List[str],
+        on_batch: Optional[Callable[[List[str], List[List[float]]], Awaitable[None]]] = None
+    ) -> List[List[float]]:
+        """Embed texts, awaiting on_batch(batch, vectors) as each batch completes; returns vectors in input order"""
+        if not texts:
+            return []
+        start_time = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: Dict[int, List[List[float]]] = {}
+
+        async def run(position: int, batch: List[str], tokens: int):
+            async with semaphore:
+                vectors = await self._embed_batch(batch, tokens)
+            results[position] = vectors
+            self.chunks_embedded += len(batch)
+            self.tokens_embedded += tokens
+            metrics.inc("progression_embedding_tokens_total", tokens, purpose="ingest")
+            if on_batch:
+                await on_batch(batch, vectors)
+
+        batches = await run_blocking(self.make_batches, texts)
+        tasks = [
+            asyncio.create_task(run(position, batch, tokens))
+            for position, (batch, tokens) in enumerate(batches)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        elapsed = time.monotonic() - start_time
+        self.busy_seconds += elapsed
+        self.last_chunks_per_second = len(texts) / elapsed if elapsed > 0 else None
+        return [vector for position in range(len(tasks)) for vector in results[position]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks_embedded": self.chunks_embedded,
+            "tokens_embedded": self.tokens_embedded,
+            "requests": self.requests,
+            "retries": self.retries,
+            "chunks_per_second": self.chunks_embedded / self.busy_seconds if self.busy_seconds else None,
+            "last_chunks_per_second": self.last_chunks_per_second,
+        }
+
+embedding_scheduler = EmbeddingScheduler(
+    EMBED_BATCH_TOKENS,
+    EMBED_BATCH_MAX_INPUTS,
+    EMBED_CONCURRENCY,
+    EMBED_RPM,
+    EMBED_TPM,
+    EMBED_MAX_RETRIES
+)
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file, read in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(functools.partial(f.read, 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 # Database setup
+class SqlitePool:
+    """
+    Pool of connections to the metadata database, shared by the blocking worker threads.
+    Connections are opened on demand up to size and reused, so each keeps its cache of prepared
+    statements across calls. The database runs in WAL mode: readers never block the writer or each
+    other, and writers wait up to busy_timeout_ms for the write lock instead of failing.
+    """
+
+    def __init__(self, path: Path, size: int, busy_timeout_ms: int):
+        self.path = path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle: List[sqlite3.Connection] = []
+        self._opened = 0
+        self._available = threading.Condition()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; write transactions are opened explicitly by transaction()
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        # Safe in WAL mode: a power loss may drop the last commits but never corrupts the database
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for reads or single statements"""
+        with self._available:
+            while not self._idle and self._opened >= self.size:
+                self._available.wait()
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._available:
+                    self._opened -= 1
+                    self._available.notify()
+                raise
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._available:
+                self._idle.append(conn)
+                self._available.notify()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        A write transaction, committed on success and rolled back on error.
+        BEGIN IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout
+        instead of deadlocking when a read transaction tries to upgrade.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        with self._available:
+            for conn in self._idle:
+                conn.close()
+            self._opened -= len(self._idle)
+            self._idle.clear()
+
+db_pool = SqlitePool(DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS)
+
 def init_db():
     """Initialize SQLite database for notebook metadata"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notebooks (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            sources_count INTEGER DEFAULT 1
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        # Persistent setting of the database file
+        conn.execute("PRAGMA journal_mode = WAL")
+    with db_pool.transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS notebooks (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                sources_count INTEGER DEFAULT 1
+            )
+        """)
+        # Databases created before background ingestion have no status column
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(notebooks)")]
+        if "status" not in columns:
+            conn.execute("ALTER TABLE notebooks ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'")
+        # Last query time, for warming the index cache at startup (see recently_used_notebooks)
+        if "last_used_at" not in columns:
+            conn.execute("ALTER TABLE notebooks ADD COLUMN last_used_at TEXT")
+        # Worker process indexing a new notebook, so a restart only fails notebooks whose worker is gone
+        if "indexing_owner" not in columns:
+            conn.execute("ALTER TABLE notebooks ADD COLUMN indexing_owner TEXT")
+        # Newest-first listing pages walk this index (see list_notebooks_page)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notebooks_created_at ON notebooks (created_at, id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                notebook_id TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                content_sha256 TEXT NOT NULL,
+                num_chunks INTEGER,
+                added_at TEXT NOT NULL,
+                PRIMARY KEY (notebook_id, file_name)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sources_content_sha256 ON sources (content_sha256)")
+        # Ingestion jobs as IngestJob JSON, so any worker can report a job another worker is running
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                job TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
 
-init_db()
+        # Notebooks created before multi-PDF support get a source row per stored PDF
+        rows = conn.execute(
+            "SELECT id FROM notebooks WHERE status = 'ready' AND id NOT IN (SELECT notebook_id FROM sources)"
+        ).fetchall()
+        for (notebook_id,) in rows:
+            for pdf_path in sorted((PDFS_DIR / notebook_id).glob("*.pdf")):
+                conn.execute(
+                    "INSERT INTO sources (notebook_id, file_name, content_sha256, num_chunks, added_at) VALUES (?, ?, ?, ?, ?)",
+                    (notebook_id, pdf_path.name, file_sha256(str(pdf_path)), None, datetime.utcnow().isoformat())
+                )
+            conn.execute(
+                "UPDATE notebooks SET sources_count = (SELECT COUNT(*) FROM sources WHERE notebook_id = ?) WHERE id = ?",
+                (notebook_id, notebook_id)
+            )
+
+def init_storage():
+    """
+    Create the data directories and databases (idempotent). The server runs this at startup;
+    scripts that use storage without starting the server call it themselves.
+    """
+    for directory in (DATA_DIR, PDFS_DIR, INDEX_DIR, WORKERS_DIR):
+        directory.mkdir(exist_ok=True)
+    init_db()
+    embedding_cache.init()
+    web_cache.init()
 
 # Database operations
-def insert_notebook(notebook_id: str, name: str):
-    """Insert a new notebook record"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO notebooks (id, name, created_at, sources_count) VALUES (?, ?, ?, ?)",
-        (notebook_id, name, datetime.utcnow().isoformat(), 1)
+# Every statement uses ? parameters with fixed SQL text, so pooled connections reuse their prepared statements
+def insert_notebook(notebook_id: str, name: str, status: str = "ready", indexing_owner: Optional[str] = None):
+    """Insert a new notebook record; indexing_owner is the worker indexing it"""
+    with db_pool.transaction() as conn:
+        conn.execute(
+            "INSERT INTO notebooks (id, name, created_at, sources_count, status, indexing_owner) VALUES (?, ?, ?, ?, ?, ?)",
+            (notebook_id, name, datetime.utcnow().isoformat(), 0, status, indexing_owner)
+        )
+
+def encode_notebooks_cursor(created_at: str, notebook_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, notebook_id]).encode()).decode()
+
+def decode_notebooks_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, notebook_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), str(notebook_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def list_notebooks_page(limit: int, after: Optional[tuple[str, str]] = None) -> tuple[List[Notebook], Optional[str]]:
+    """
+    One page of notebooks, newest first, starting after the (created_at, id) of the previous page's
+    last row. Keyset pagination seeks the created_at index, so deep pages cost the same as the first.
+    Returns the notebooks and the cursor for the next page (None on the last page).
+    """
+    with db_pool.connection() as conn:
+        if after is None:
+            rows = conn.execute(
+                "SELECT id, name, created_at, sources_count, status FROM notebooks "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (limit + 1,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, name, created_at, sources_count, status FROM notebooks "
+                "WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*after, limit + 1)
+            ).fetchall()
+    notebooks = [Notebook(id=r[0], name=r[1], created_at=r[2], sources_count=r[3], status=r[4]) for r in rows[:limit]]
+    next_cursor = encode_notebooks_cursor(rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+    return notebooks, next_cursor
+
+def get_notebook_names(notebook_ids: Optional[List[str]] = None) -> Dict[str, str]:
+    """Names of the given notebooks, or of every ready notebook, by id"""
+    with db_pool.connection() as conn:
+        if notebook_ids is None:
+            rows = conn.execute("SELECT id, name FROM notebooks WHERE status = 'ready'").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, name FROM notebooks WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(notebook_ids),)
+            ).fetchall()
+    return dict(rows)
+
+def get_notebook_status(notebook_id: str) -> Optional[str]:
+    """Get the indexing status of a notebook, or None if it does not exist"""
+    with db_pool.connection() as conn:
+        row = conn.execute("SELECT status FROM notebooks WHERE id = ?", (notebook_id,)).fetchone()
+    return row[0] if row else None
+
+def set_notebook_status(notebook_id: str, status: str) -> bool:
+    """Update the indexing status of a notebook, returning False if it no longer exists"""
+    with db_pool.transaction() as conn:
+        return conn.execute("UPDATE notebooks SET status = ? WHERE id = ?", (status, notebook_id)).rowcount > 0
+
+def finish_source_ingestion(notebook_id: str, file_name: str, content_sha256: str, num_chunks: int) -> bool:
+    """
+    Record an indexed source and mark its notebook ready, in one transaction.
+    Returns False if the notebook was deleted in the meantime.
+    """
+    with db_pool.transaction() as conn:
+        if conn.execute("UPDATE notebooks SET status = 'ready' WHERE id = ?", (notebook_id,)).rowcount == 0:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO sources (notebook_id, file_name, content_sha256, num_chunks, added_at) VALUES (?, ?, ?, ?, ?)",
+            (notebook_id, file_name, content_sha256, num_chunks, datetime.utcnow().isoformat())
+        )
+        conn.execute(
+            "UPDATE notebooks SET sources_count = (SELECT COUNT(*) FROM sources WHERE notebook_id = ?) WHERE id = ?",
+            (notebook_id, notebook_id)
+        )
+    return True
+
+def get_sources(notebook_id: str) -> List[NotebookSource]:
+    """Get the PDFs of a notebook in the order they were added"""
+    with db_pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT file_name, content_sha256, num_chunks, added_at FROM sources WHERE notebook_id = ? ORDER BY added_at",
+            (notebook_id,)
+        ).fetchall()
+    return [NotebookSource(file_name=r[0], content_sha256=r[1], num_chunks=r[2], added_at=r[3]) for r in rows]
+
+def find_source_by_content_hash(content_sha256: str) -> Optional[tuple[str, str]]:
+    """Find an indexed source (notebook_id, file_name) built from an identical PDF"""
+    with db_pool.connection() as conn:
+        row = conn.execute(
+            """
+            SELECT s.notebook_id, s.file_name FROM sources s
+            JOIN notebooks n ON n.id = s.notebook_id
+            WHERE s.content_sha256 = ? AND n.status = 'ready'
+            LIMIT 1
+            """,
+            (content_sha256,)
+        ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def delete_source_record(notebook_id: str, file_name: str) -> bool:
+    """Delete a source record and update the notebook's source count"""
+    with db_pool.transaction() as conn:
+        deleted_count = conn.execute(
+            "DELETE FROM sources WHERE notebook_id = ? AND file_name = ?", (notebook_id, file_name)
+        ).rowcount
+        conn.execute(
+            "UPDATE notebooks SET sources_count = (SELECT COUNT(*) FROM sources WHERE notebook_id = ?) WHERE id = ?",
+            (notebook_id, notebook_id)
+        )
+    return deleted_count > 0
+
+def save_job_record(job_id: str, owner: str, status: str, created_at: str, job_json: str):
+    """Insert or update an ingestion job, dropping the oldest finished jobs beyond INGEST_JOB_HISTORY"""
+    with db_pool.transaction() as conn:
+        inserted = conn.execute(
+            "UPDATE jobs SET status = ?, job = ? WHERE job_id = ?", (status, job_json, job_id)
+        ).rowcount == 0
+        if inserted:
+            conn.execute(
+                "INSERT INTO jobs (job_id, owner, status, created_at, job) VALUES (?, ?, ?, ?, ?)",
+                (job_id, owner, status, created_at, job_json)
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('ready', 'failed') AND job_id NOT IN "
+                "(SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (INGEST_JOB_HISTORY,)
+            )
+
+def delete_job_record(job_id: str):
+    with db_pool.transaction() as conn:
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+def get_job_record(job_id: str) -> Optional[tuple[IngestJob, str]]:
+    """An ingestion job as last saved by the worker running it, with that worker's id"""
+    with db_pool.connection() as conn:
+        row = conn.execute("SELECT job, owner FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return (IngestJob(**json.loads(row[0])), row[1]) if row else None
+
+def fail_interrupted_notebooks() -> int:
+    """
+    Mark notebooks left 'indexing', and jobs left unfinished, by worker processes that are gone as
+    failed; their jobs were lost. Those of running workers (e.g. siblings of a restarted worker) are
+    left alone. Returns the number of jobs failed
+    """
+    with db_pool.connection() as conn:
+        notebooks = conn.execute("SELECT id, indexing_owner FROM notebooks WHERE status = 'indexing'").fetchall()
+        jobs = conn.execute("SELECT job_id, owner, job FROM jobs WHERE status NOT IN ('ready', 'failed')").fetchall()
+    # Notebooks from before owners were recorded have none, so their worker is gone too
+    owners = {owner for _, owner in notebooks} | {owner for _, owner, _ in jobs}
+    gone = {owner for owner in owners if not worker_alive(owner)}
+    with db_pool.transaction() as conn:
+        for notebook_id, owner in notebooks:
+            if owner in gone:
+                conn.execute(
+                    "UPDATE notebooks SET status = 'failed' WHERE id = ? AND status = 'indexing' AND indexing_owner IS ?",
+                    (notebook_id, owner)
+                )
+        failed = 0
+        for job_id, owner, job_json in jobs:
+            if owner in gone:
+                job = IngestJob(**json.loads(job_json))
+                job.status = "failed"
+                job.error = "Indexing was interrupted: the server process running it stopped"
+                conn.execute("UPDATE jobs SET status = ?, job = ? WHERE job_id = ?", (job.status, job.json(), job_id))
+                failed += 1
+    return failed
+
+def touch_notebook(notebook_id: str, used_at: str):
+    """Record when a notebook was last queried"""
+    with db_pool.transaction() as conn:
+        conn.execute("UPDATE notebooks SET last_used_at = ? WHERE id = ?", (used_at, notebook_id))
+
+def recently_used_notebooks(limit: int) -> List[str]:
+    """IDs of ready notebooks, most recently queried (or, if never queried, created) first"""
+    with db_pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT id FROM notebooks WHERE status = 'ready' ORDER BY COALESCE(last_used_at, created_at) DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def delete_notebook_record(notebook_id: str) -> bool:
+    """Delete a notebook record, returning False if it did not exist"""
+    with db_pool.transaction() as conn:
+        deleted_count = conn.execute("DELETE FROM notebooks WHERE id = ?", (notebook_id,)).rowcount
+        conn.execute("DELETE FROM sources WHERE notebook_id = ?", (notebook_id,))
+    return deleted_count > 0
+
+def delete_notebook_files(notebook_id: str):
+    """Remove the stored PDFs and index of a notebook"""
+    for directory in (PDFS_DIR / notebook_id, INDEX_DIR / notebook_id):
+        if directory.exists():
+            shutil.rmtree(directory)
+    notebook_lock_path(notebook_id).unlink(missing_ok=True)
+
+# Worker liveness
+# Every server process holds an flock on its own file under data/workers while it runs. Notebooks and
+# jobs being indexed record that worker's id; if another process can lock the file, its owner is gone.
+worker_state: Dict[str, Any] = {"id": None, "lock_file": None}
+worker_claim_lock = threading.Lock()
+
+def worker_lock_path(worker_id: str) -> Path:
+    return WORKERS_DIR / f"{worker_id}.lock"
+
+def claim_worker() -> str:
+    """Give this process a worker id and hold its lock file until release_worker"""
+    worker_id = uuid.uuid4().hex
+    lock_file = open(worker_lock_path(worker_id), "a")
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    worker_state.update(id=worker_id, lock_file=lock_file)
+    return worker_id
+
+def release_worker():
+    lock_file = worker_state["lock_file"]
+    if lock_file is not None:
+        worker_lock_path(worker_state["id"]).unlink(missing_ok=True)
+        lock_file.close()
+        worker_state.update(id=None, lock_file=None)
+
+def current_worker() -> str:
+    # Scripts that ingest without starting the server claim a worker id on first use
+    if worker_state["id"] is None:
+        with worker_claim_lock:
+            if worker_state["id"] is None:
+                claim_worker()
+    return worker_state["id"]
+
+def worker_alive(worker_id: Optional[str]) -> bool:
+    """Whether the worker process with this id is still running"""
+    if worker_id is None:
+        return False
+    if worker_id == worker_state["id"]:
+        return True
+    if fcntl is None:
+        # Without file locks only one worker process runs (see notebook_lock), and it is this one
+        return False
+    try:
+        lock_file = open(worker_lock_path(worker_id), "r")
+    except FileNotFoundError:
+        return False
+    with lock_file:
+        if not try_lock_file(lock_file):
+            return True
+        # Closing the file releases the lock again
+        worker_lock_path(worker_id).unlink(missing_ok=True)
+        return False
+
+# Startup
+# Readiness of this worker: set once the background warm-up after startup has finished
+startup_state: Dict[str, Any] = {
+    "ready": False,
+    "error": None,
+    "clients_seconds": None,
+    "notebooks_warmed": 0,
+    "warmup_seconds": None,
+}
+
+async def warm_up():
+    """
+    Create the API clients (importing their libraries off the event loop), then load the
+    WARMUP_NOTEBOOKS most recently used notebooks into the index cache, and mark the worker ready.
+    Requests are served meanwhile; they create clients and load indexes themselves if they need them first.
+    """
+    start_time = time.perf_counter()
+    try:
+        await run_blocking(create_clients)
+    except Exception as e:
+        # Usually a missing API key; the readiness probe reports it and stays unready
+        startup_state["error"] = f"Failed to create API clients: {e}"
+        print(f"❌ {startup_state['error']}")
+        return
+    startup_state["clients_seconds"] = round(time.perf_counter() - start_time, 3)
+
+    session_ids = await run_blocking(recently_used_notebooks, min(WARMUP_NOTEBOOKS, INDEX_CACHE_MAX_ENTRIES))
+
+    async def warm(session_id: str) -> bool:
+        try:
+            await get_vectorstore(session_id)
+            return True
+        except Exception as e:
+            print(f"Warm-up skipped notebook {session_id}: {e}")
+            return False
+
+    warmed = await asyncio.gather(*(warm(session_id) for session_id in session_ids))
+    startup_state.update(
+        ready=True,
+        notebooks_warmed=sum(warmed),
+        warmup_seconds=round(time.perf_counter() - start_time, 3)
+    )
+
+# Last-use times are written at most once per NOTEBOOK_USE_INTERVAL per notebook and worker, in the background
+NOTEBOOK_USE_INTERVAL = 60.0
+notebook_uses: Dict[str, float] = {}
+notebook_use_writes: Dict[str, asyncio.Task] = {}
+
+async def write_notebook_use(session_id: str, used_at: str):
+    try:
+        await run_blocking(touch_notebook, session_id, used_at)
+    except Exception as e:
+        print(f"Recording use of notebook {session_id} failed: {e}")
+    finally:
+        notebook_use_writes.pop(session_id, None)
+
+def record_notebook_use(session_id: str):
+    now = time.time()
+    if now - notebook_uses.get(session_id, 0.0) < NOTEBOOK_USE_INTERVAL or session_id in notebook_use_writes:
+        return
+    notebook_uses[session_id] = now
+    notebook_use_writes[session_id] = asyncio.create_task(
+        write_notebook_use(session_id, datetime.utcnow().isoformat())
     )
-    conn.commit()
-    conn.close()
-
-def get_all_notebooks() -> List[Notebook]:
-    """Get all notebooks sorted by creation date"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, created_at, sources_count FROM notebooks ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    return [Notebook(id=r[0], name=r[1], created_at=r[2], sources_count=r[3]) for r in rows]
 
 # FastAPI app
-app = FastAPI(title="Progression LM API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare storage and start the ingestion workers on startup, then warm up in the background
+    (see warm_up and /api/v1/ready); stop everything on shutdown
+    """
+    await run_blocking(init_storage)
+    await run_blocking(current_worker)
+    await run_blocking(fail_interrupted_notebooks)
+    await ingestion_queue.start()
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    await asyncio.gather(warmup_task, return_exceptions=True)
+    await ingestion_queue.stop()
+    # Jobs this worker did not finish are failed by the next worker that starts or looks them up
+    await run_blocking(release_worker)
+    await run_blocking(db_pool.close)
+    if parse_executor is not None:
+        # Wait for the workers to exit so none outlive the server
+        await run_blocking(parse_executor.shutdown, wait=True, cancel_futures=True)
+
+app = FastAPI(title="Progression LM API", version="1.0.0", lifespan=lifespan)
+
+# Upload size limit
+class UploadSizeLimitMiddleware:
+    """
+    Reject multipart uploads larger than max_bytes before they are spooled to disk:
+    up front from Content-Length, or as soon as a body without one crosses the limit.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": upload_too_large_error().detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise upload_too_large_error()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def upload_too_large_error() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"PDF exceeds the {MAX_UPLOAD_MB} MB upload limit")
+
+# Allow for multipart boundaries and the other form fields on top of the file itself
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_MB * 1024 * 1024 + 64 * 1024)
 
 # CORS middleware
 app.add_middleware(
@@ -161,76 +1890,971 @@ async def global_exception_handler(request, exc):
         }
     )
 
-# PDF Processing Functions
-def process_pdf(file_path: str, session_id: str) -> tuple[FAISS, int]:
+# PDF Processing Functions
+def parse_pdf_pages(file_path: str, session_id: str, pages: Optional[List[int]] = None) -> List[Document]:
+    """
+    Parse PDF pages (0-based, all by default) using PyMuPDF4LLM with page-level chunking.
+    Returns one Document per page with page metadata.
+    """
+    # Load PDF with page-level chunks
+    import pymupdf4llm  # loaded by the parse workers only
+
+    md_text = pymupdf4llm.to_markdown(file_path, pages=pages, page_chunks=True)
+
+    # Parse the markdown output to create documents with metadata
+    documents = []
+    current_page = pages[0] + 1 if pages else 1
+
+    # Split by page markers if present
+    if isinstance(md_text, list):
+        # PyMuPDF4LLM returns list of dicts with page_chunks=True
+        for item in md_text:
+            item_metadata = item.get('metadata', {})
+            page_num = item_metadata.get('page', item_metadata.get('page_number', current_page))
+            text = item.get('text', '')
+
+            doc = Document(
+                page_content=text,
+                metadata={
+                    'file_name': os.path.basename(file_path),
+                    'page_number': page_num,
+                    'page_start': page_num,
+                    'page_end': page_num,
+                    'session_id': session_id
+                }
+            )
+            documents.append(doc)
+            current_page = page_num + 1
+    else:
+        # Fallback: single document
+        doc = Document(
+            page_content=md_text,
+            metadata={
+                'file_name': os.path.basename(file_path),
+                'page_number': 1,
+                'page_start': 1,
+                'page_end': 1,
+                'session_id': session_id
+            }
+        )
+        documents.append(doc)
+
+    return documents
+
+def parse_and_split_pages(file_path: str, session_id: str, pages: List[int]) -> List[Document]:
+    """Parse a range of pages and split them into chunks; runs in a parse pool worker"""
+    return text_splitter.split_documents(parse_pdf_pages(file_path, session_id, pages))
+
+def pdf_page_count(file_path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(file_path) as pdf_doc:
+        return pdf_doc.page_count
+
+async def parse_pdf_pipeline(
+    file_path: str,
+    session_id: str,
+    progress: Optional[Callable[..., None]] = None
+) -> AsyncIterator[List[Document]]:
+    """
+    Parse a PDF in ranges of PARSE_BATCH_PAGES pages on the parse pool, several ranges at a time.
+    Yields each range's chunks in page order as soon as it and every earlier range are done,
+    and reports pages_parsed/pages_total through progress.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_parse_executor()
+    page_count = await run_blocking(pdf_page_count, file_path)
+    page_ranges = [
+        list(range(start, min(start + PARSE_BATCH_PAGES, page_count)))
+        for start in range(0, page_count, PARSE_BATCH_PAGES)
+    ]
+    # Keep every worker busy without queueing the whole document at once
+    max_in_flight = max(1, PARSE_WORKERS) * 2
+    in_flight: Dict[int, asyncio.Future] = {}
+    next_range = 0
+    try:
+        for position, pages in enumerate(page_ranges):
+            while next_range < len(page_ranges) and next_range < position + max_in_flight:
+                in_flight[next_range] = loop.run_in_executor(
+                    executor, parse_and_split_pages, file_path, session_id, page_ranges[next_range]
+                )
+                next_range += 1
+            chunks = await in_flight.pop(position)
+            if progress:
+                progress(pages_parsed=pages[-1] + 1, pages_total=page_count)
+            yield chunks
+    finally:
+        for future in in_flight.values():
+            future.cancel()
+
+async def embed_texts(texts: List[str], progress: Optional[Callable[..., None]] = None) -> List[List[float]]:
+    """
+    Embed texts, calling the embedding API only for texts missing from the embedding cache.
+    Missing texts go through the embedding scheduler; each finished batch is cached immediately.
+    Reports chunks_cached, chunks_embedded and embed_chunks_per_second through progress.
+    """
+    embeddings = await run_blocking(embedding_cache.get_many, EMBEDDING_MODEL, texts)
+
+    # Each distinct missing text is embedded once, even if it repeats in the document
+    missing_counts = Counter(text for text, vector in zip(texts, embeddings) if vector is None)
+    missing_texts = list(missing_counts)
+    done = len(texts) - sum(missing_counts.values())
+    if progress:
+        progress(chunks_cached=done, chunks_embedded=done)
+
+    async def on_batch(batch: List[str], vectors: List[List[float]]):
+        nonlocal done
+        await run_blocking(embedding_cache.put_many, EMBEDDING_MODEL, batch, vectors)
+        done += sum(missing_counts[text] for text in batch)
+        if progress:
+            progress(chunks_embedded=done)
+
+    start_time = time.monotonic()
+    new_vectors = dict(zip(missing_texts, await embedding_scheduler.embed(missing_texts, on_batch)))
+    if progress and missing_texts:
+        progress(embed_chunks_per_second=len(missing_texts) / max(time.monotonic() - start_time, 1e-9))
+
+    return [vector if vector is not None else new_vectors[text] for text, vector in zip(texts, embeddings)]
+
+def cosine_relevance_score(distance: float) -> float:
+    """
+    Convert a FAISS flat-index distance (squared L2) to cosine similarity.
+    OpenAI embeddings are unit length, so cosine = 1 - d / 2; clamped to [0, 1] for LangChain.
+    """
+    return min(1.0, max(0.0, 1.0 - float(distance) / 2.0))
+
+def writable_index_copy(vectorstore: "FAISS") -> "faiss.Index":
+    """Copy of a vectorstore's index that owns its memory and may be modified"""
+    import faiss
+    if isinstance(vectorstore, mapped_faiss_class()):
+        # Clones of a memory-mapped index still view the mapped codes; a serialized copy owns them
+        return faiss.deserialize_index(faiss.serialize_index(vectorstore.index))
+    return faiss.clone_index(vectorstore.index)
+
+def copy_vectorstore(source: "FAISS") -> "FAISS":
+    """Copy a vectorstore so it can be modified while queries keep using the original"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    return FAISS(
+        embedding_function=source.embedding_function,
+        index=writable_index_copy(source),
+        docstore=InMemoryDocstore(dict(source.docstore._dict)),
+        index_to_docstore_id=dict(source.index_to_docstore_id),
+        relevance_score_fn=cosine_relevance_score
+    )
+
+def iter_chunks(vectorstore: VectorStore) -> Iterator[tuple[str, Document]]:
+    """(chunk id, chunk) pairs of a notebook's vectorstore, in either index format"""
+    if isinstance(vectorstore, MmapVectorStore):
+        for doc in vectorstore.iter_documents():
+            yield doc.id, doc
+    else:
+        yield from vectorstore.docstore._dict.items()
+
+def source_chunks(vectorstore: VectorStore, file_name: str) -> Dict[str, Document]:
+    """Chunks of one PDF in a notebook's vectorstore, by docstore id"""
+    return {
+        doc_id: doc
+        for doc_id, doc in iter_chunks(vectorstore)
+        if doc.metadata.get('file_name') == file_name
+    }
+
+def reuse_source_chunks(vectorstore: VectorStore, donor_file_name: str, session_id: str, file_name: str) -> List[Document]:
+    """Chunks of an identical PDF already indexed elsewhere, relabelled for a new notebook source"""
+    return [
+        Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, 'session_id': session_id, 'file_name': file_name}
+        )
+        for doc in source_chunks(vectorstore, donor_file_name).values()
+    ]
+
+FAISS_INDEX_FILES = ("index.faiss", "index.pkl")
+MMAP_INDEX_FILES = ("vectors.bin", "chunks.sqlite")
+
+def index_exists(session_id: str) -> bool:
+    """Whether the notebook has an index on disk, in either format"""
+    index_path = INDEX_DIR / session_id
+    return (index_path / "index.faiss").exists() or (index_path / "vectors.bin").exists()
+
+def index_version(session_id: str) -> Optional[tuple[int, int]]:
+    """Identity of the notebook's live index file; changes whenever an update swaps in new files"""
+    index_path = INDEX_DIR / session_id
+    for name in ("vectors.bin", "index.faiss"):
+        try:
+            stat = (index_path / name).stat()
+        except FileNotFoundError:
+            continue
+        return stat.st_ino, stat.st_mtime_ns
+    return None
+
+def swap_in_index_files(tmp_path: Path, session_id: str, stale_files: Iterable[str] = ()):
+    """
+    Move freshly written index files over the live ones, then drop files of the other format.
+    Each file is replaced atomically, but not the set of them: a reader can still pair files of two
+    generations, and load_vectorstore / MmapVectorStore detect that and read again
+    """
+    index_path = INDEX_DIR / session_id
+    index_path.mkdir(exist_ok=True)
+    # Write next to the live files and swap them in, so readers never see a half-written file.
+    # index.faiss goes last: readers load it before index.pkl, so a new index never meets an old
+    # docstore, and index_version (keyed on index.faiss) only changes once both files are in place
+    for file_path in sorted(tmp_path.iterdir(), key=lambda file_path: file_path.name == "index.faiss"):
+        os.replace(file_path, index_path / file_path.name)
+    tmp_path.rmdir()
+    for name in stale_files:
+        (index_path / name).unlink(missing_ok=True)
+
+def index_tmp_path(session_id: str) -> Path:
+    return INDEX_DIR / f".{session_id}.{uuid.uuid4().hex}.tmp"
+
+def save_vectorstore(vectorstore: "FAISS", session_id: str):
+    """Persist a FAISS vectorstore under the notebook's index directory"""
+    tmp_path = index_tmp_path(session_id)
+    vectorstore.save_local(str(tmp_path))
+    swap_in_index_files(tmp_path, session_id, MMAP_INDEX_FILES)
+
+def save_mmap_index(
+    session_id: str,
+    documents: List[Document],
+    vector_blocks: Iterable[np.ndarray],
+    dim: int,
+    dtype: str
+) -> MmapVectorStore:
+    """Write a new generation of a notebook's memory-mapped index and open it"""
+    swap_in_mmap_index(session_id, documents, vector_blocks, dim, dtype)
+    return open_mmap_index(INDEX_DIR / session_id)
+
+def swap_in_mmap_index(
+    session_id: str,
+    documents: List[Document],
+    vector_blocks: Iterable[np.ndarray],
+    dim: int,
+    dtype: str
+):
+    """Write a new generation of a notebook's memory-mapped index and swap it in"""
+    tmp_path = index_tmp_path(session_id)
+    try:
+        write_mmap_index(tmp_path, documents, vector_blocks, dim, dtype)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    swap_in_index_files(tmp_path, session_id, FAISS_INDEX_FILES)
+
+def open_mmap_index(index_path: Path) -> MmapVectorStore:
+    """Open a memory-mapped index, retrying briefly if a writer is swapping in a new generation"""
+    for attempt in range(3):
+        try:
+            return MmapVectorStore(index_path, get_embedding_model())
+        except ValueError:
+            if attempt == 2:
+                raise
+            time.sleep(0.05)
+
+async def process_pdf(
+    file_path: str,
+    session_id: str,
+    progress: Optional[Callable[..., None]] = None
+) -> tuple[List[Document], List[List[float]]]:
+    """
+    Parse and embed one PDF as a pipeline: page ranges are parsed in the parse pool while chunks
+    of earlier pages are already being embedded, PIPELINE_EMBED_CHUNKS at a time.
+    Progress fields (pages_parsed, pages_total, chunks_cached, chunks_embedded, chunks_total,
+    embed_chunks_per_second) are passed to progress as they change.
+    Returns the chunks in page order and their embeddings.
+    """
+    def report(**fields):
+        if progress:
+            progress(**fields)
+
+    chunks: List[Document] = []
+    embeddings: List[List[float]] = []
+    counts = {"chunks_cached": 0, "chunks_embedded": 0}
+    embed_queue: "asyncio.Queue[Optional[List[Document]]]" = asyncio.Queue()
+    embed_seconds = 0.0
+
+    async def embed_worker():
+        # One group at a time, in page order; the scheduler parallelizes requests within a group
+        nonlocal embed_seconds
+        while (group := await embed_queue.get()) is not None:
+            group_start = time.monotonic()
+            before = dict(counts)
+
+            def group_progress(**fields):
+                for key in counts:
+                    if key in fields:
+                        counts[key] = before[key] + fields[key]
+                report(**counts)
+
+            with stage("embedding"):
+                embeddings.extend(await embed_texts([chunk.page_content for chunk in group], group_progress))
+            embed_seconds += time.monotonic() - group_start
+
+    embed_task = asyncio.create_task(embed_worker())
+    try:
+        pending: List[Document] = []
+        # Handing chunks to the embed worker never blocks, so this is the parsing time
+        with stage("pdf_parse"):
+            async for page_chunks in parse_pdf_pipeline(file_path, session_id, report):
+                if embed_task.done():
+                    # Embedding failed; surface its error instead of parsing the rest
+                    await embed_task
+                chunks.extend(page_chunks)
+                pending.extend(page_chunks)
+                if len(pending) >= PIPELINE_EMBED_CHUNKS:
+                    embed_queue.put_nowait(pending)
+                    pending = []
+
+        if not chunks:
+            raise ValueError("No extractable text found in PDF")
+        report(chunks_total=len(chunks))
+        if pending:
+            embed_queue.put_nowait(pending)
+        embed_queue.put_nowait(None)
+        await embed_task
+    finally:
+        embed_task.cancel()
+
+    embedded = len(chunks) - counts["chunks_cached"]
+    if embedded:
+        report(embed_chunks_per_second=embedded / max(embed_seconds, 1e-9))
+    return chunks, embeddings
+
+# Per-notebook locks serialize index updates; queries never wait on them
+notebook_locks: Dict[str, asyncio.Lock] = {}
+
+def notebook_lock_path(session_id: str) -> Path:
+    return INDEX_DIR / f".{session_id}.lock"
+
+def try_lock_file(file) -> bool:
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+@asynccontextmanager
+async def notebook_lock(session_id: str) -> AsyncIterator[None]:
+    """
+    Hold the notebook's update lock: an asyncio lock within this worker, plus an flock on the
+    notebook's lock file so updates from other worker processes wait too
+    """
+    async with notebook_locks.setdefault(session_id, asyncio.Lock()):
+        if fcntl is None:
+            yield
+            return
+        lock_file = await run_blocking(open, notebook_lock_path(session_id), "a")
+        try:
+            # Polled rather than blocking, so a long update elsewhere does not hold a blocking thread
+            while not try_lock_file(lock_file):
+                await asyncio.sleep(0.05)
+            yield
+        finally:
+            # Closing the file releases the flock
+            lock_file.close()
+
+def extend_vectorstore(
+    existing: Optional["FAISS"],
+    chunks: List[Document],
+    embeddings: List[List[float]]
+) -> "FAISS":
+    """
+    Return a new vectorstore with the chunks appended; existing vectors are never re-embedded.
+    New indexes use INDEX_MODE and EMBEDDING_DIMENSIONS. A flat index is rebuilt in the configured
+    mode once it grows into it (its vectors are exact); other indexes keep their trained quantizers.
+    """
+    import faiss
+    dims = existing.index.d if existing is not None else EMBEDDING_DIMENSIONS
+    vectors = truncate_embeddings(embeddings, dims)
+    text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)]
+    metadatas = [chunk.metadata for chunk in chunks]
+
+    if existing is None:
+        updated = new_faiss_store(build_faiss_index(vectors))
+    elif isinstance(existing.index, faiss.IndexFlat) and faiss_index_spec(
+        existing.index.ntotal + len(vectors), existing.index.d
+    ) != "Flat":
+        doc_ids = [existing.index_to_docstore_id[i] for i in range(existing.index.ntotal)]
+        old_vectors = existing.index.reconstruct_n(0, existing.index.ntotal)
+        updated = new_faiss_store(build_faiss_index(np.concatenate([old_vectors, vectors])))
+        old_docs = [existing.docstore.search(doc_id) for doc_id in doc_ids]
+        updated.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in zip(old_docs, old_vectors)],
+            metadatas=[doc.metadata for doc in old_docs],
+            ids=doc_ids
+        )
+    else:
+        updated = copy_vectorstore(existing)
+    updated.add_embeddings(text_embeddings, metadatas=metadatas, ids=[chunk.id for chunk in chunks])
+    return updated
+
+def new_faiss_store(index: "faiss.Index") -> "FAISS":
+    """Empty LangChain FAISS store around a prepared index"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    return FAISS(
+        embedding_function=TruncatedEmbeddings(get_embedding_model(), index.d),
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+        relevance_score_fn=cosine_relevance_score
+    )
+
+def extend_mmap_index(
+    session_id: str,
+    existing: Optional[MmapVectorStore],
+    chunks: List[Document],
+    embeddings: List[List[float]]
+) -> MmapVectorStore:
+    """Write the notebook's memory-mapped index with the chunks appended, streaming existing vectors across"""
+    new_vectors = truncate_embeddings(embeddings, existing.dim if existing is not None else EMBEDDING_DIMENSIONS)
+    documents = [Document(id=chunk.id, page_content=chunk.page_content, metadata=chunk.metadata) for chunk in chunks]
+    if existing is None:
+        return save_mmap_index(session_id, documents, [new_vectors], new_vectors.shape[1], INDEX_MMAP_DTYPE)
+    return save_mmap_index(
+        session_id,
+        list(existing.iter_documents()) + documents,
+        itertools.chain(existing.vector_blocks(), [new_vectors]),
+        existing.dim,
+        np.dtype(existing.dtype).name
+    )
+
+async def add_chunks_to_notebook(session_id: str, chunks: List[Document], embeddings: List[List[float]]):
+    """
+    Append embedded chunks to the notebook's vector index on disk (creating it if needed, keeping
+    its format), then to its lexical index.
+    """
+    for chunk in chunks:
+        chunk.id = str(uuid.uuid4())
+    async with notebook_lock(session_id):
+        existing = None
+        if index_exists(session_id):
+            existing = await get_vectorstore(session_id)
+        if isinstance(existing, MmapVectorStore) or (existing is None and INDEX_FORMAT == "mmap"):
+            vectorstore = await run_blocking(extend_mmap_index, session_id, existing, chunks, embeddings)
+        else:
+            vectorstore = await run_blocking(extend_vectorstore, existing, chunks, embeddings)
+            await run_blocking(save_vectorstore, vectorstore, session_id)
+
+        # Replace any stale copy so the next query sees the updated index
+        version = await run_blocking(index_version, session_id)
+        # Sizing the entry walks the docstore, so it stays off the event loop
+        await run_blocking(vectorstore_cache.put, session_id, vectorstore, version)
+        answer_cache.invalidate(session_id)
+
+        if existing is None or await run_blocking(lexical_index_path(session_id).exists):
+            await run_blocking(add_to_lexical_index, session_id, chunks)
+        else:
+            # Notebook indexed before lexical indexes existed: index all of its chunks now
+            await run_blocking(build_lexical_index, session_id, vectorstore)
+
+def rebuild_vectorstore_without(existing: "FAISS", removed_ids: List[str]) -> "FAISS":
+    """
+    Rebuild a FAISS vectorstore from its remaining chunks, re-training quantizers on them.
+    Vectors come from the embedding cache at full precision, decoding the index only for cache misses.
+    """
+    import faiss
+    removed = set(removed_ids)
+    kept = [(i, doc_id) for i, doc_id in sorted(existing.index_to_docstore_id.items()) if doc_id not in removed]
+    docs = [existing.docstore.search(doc_id) for _, doc_id in kept]
+    cached = embedding_cache.get_many(EMBEDDING_MODEL, [doc.page_content for doc in docs])
+
+    decoder = None
+    vectors = []
+    for (i, _), vector in zip(kept, cached):
+        if vector is None:
+            if decoder is None:
+                # Decode from a copy: building the direct map must not touch the index queries are using
+                decoder = writable_index_copy(existing)
+                faiss.extract_index_ivf(decoder).make_direct_map()
+            vector = decoder.reconstruct(i)
+        vectors.append(truncate_embeddings([vector], existing.index.d)[0])
+    vectors = np.stack(vectors)
+
+    updated = new_faiss_store(build_faiss_index(vectors))
+    updated.add_embeddings(
+        [(doc.page_content, vector) for doc, vector in zip(docs, vectors)],
+        metadatas=[doc.metadata for doc in docs],
+        ids=[doc_id for _, doc_id in kept]
+    )
+    return updated
+
+def remove_from_vectorstore(existing: "FAISS", file_name: str) -> tuple["FAISS", int]:
+    """Return a new vectorstore without the chunks of one PDF, and how many were removed"""
+    import faiss
+    doc_ids = list(source_chunks(existing, file_name))
+    if doc_ids and faiss.try_extract_index_ivf(existing.index) is not None:
+        # IVF indexes keep their internal ids after remove_ids, but LangChain's delete assumes
+        # they are compacted like a flat index; rebuild from the remaining chunks instead
+        return rebuild_vectorstore_without(existing, doc_ids), len(doc_ids)
+    updated = copy_vectorstore(existing)
+    if doc_ids:
+        updated.delete(doc_ids)
+    return updated, len(doc_ids)
+
+def remove_from_mmap_index(session_id: str, existing: MmapVectorStore, file_name: str) -> tuple[MmapVectorStore, int]:
+    """Write the notebook's memory-mapped index without the chunks of one PDF, returning how many were removed"""
+    documents = list(existing.iter_documents())
+    keep = np.array([doc.metadata.get('file_name') != file_name for doc in documents], dtype=bool)
+    updated = save_mmap_index(
+        session_id,
+        [doc for doc, kept in zip(documents, keep) if kept],
+        existing.vector_blocks(keep),
+        existing.dim,
+        np.dtype(existing.dtype).name
+    )
+    return updated, int(len(keep) - keep.sum())
+
+async def remove_source_from_notebook(session_id: str, file_name: str) -> int:
+    """Drop one PDF's chunks from the notebook's index on disk, returning the number removed"""
+    async with notebook_lock(session_id):
+        # Lexical hits carry their own text, so drop them first; a stale vector hit is harmless
+        if await run_blocking(lexical_index_path(session_id).exists):
+            await run_blocking(remove_from_lexical_index, session_id, file_name)
+        existing = await get_vectorstore(session_id)
+        if isinstance(existing, MmapVectorStore):
+            vectorstore, removed = await run_blocking(remove_from_mmap_index, session_id, existing, file_name)
+        else:
+            vectorstore, removed = await run_blocking(remove_from_vectorstore, existing, file_name)
+            await run_blocking(save_vectorstore, vectorstore, session_id)
+        version = await run_blocking(index_version, session_id)
+        # Sizing the entry walks the docstore, so it stays off the event loop
+        await run_blocking(vectorstore_cache.put, session_id, vectorstore, version)
+        answer_cache.invalidate(session_id)
+        return removed
+
+def load_vectorstore(session_id: str) -> VectorStore:
+    """Load a notebook's vectorstore, preferring the memory-mapped format when present"""
+    index_path = INDEX_DIR / session_id
+    if not index_exists(session_id):
+        status = get_notebook_status(session_id)
+        if status == "indexing":
+            raise HTTPException(status_code=409, detail="Notebook is still indexing")
+        if status == "failed":
+            raise HTTPException(status_code=409, detail="Notebook indexing failed")
+        raise HTTPException(status_code=404, detail="Notebook not found")
+
+    if (index_path / "vectors.bin").exists():
+        return open_mmap_index(index_path)
+    return open_faiss_index(index_path)
+
+def read_faiss_index(index_path: Path) -> "FAISS":
+    """Load a FAISS notebook index; raises ValueError if its two files are from different generations"""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    if SHARED_INDEXES:
+        vectorstore = mapped_faiss_class().load_local(
+            str(index_path),
+            get_embedding_model(),
+            allow_dangerous_deserialization=True,
+            relevance_score_fn=cosine_relevance_score,
+            io_flags=faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        )
+    else:
+        vectorstore = FAISS.load_local(
+            str(index_path),
+            get_embedding_model(),
+            allow_dangerous_deserialization=True,
+            relevance_score_fn=cosine_relevance_score
+        )
+    # An update swapped index.pkl in after index.faiss was read: every update adds or removes chunks,
+    # so the docstore mapping no longer matches the vectors' positions
+    if vectorstore.index.ntotal != len(vectorstore.index_to_docstore_id):
+        raise ValueError(f"{index_path.name}: index.faiss and index.pkl are from different generations")
+    return vectorstore
+
+def open_faiss_index(index_path: Path) -> "FAISS":
+    """Open a FAISS notebook index, retrying briefly if a writer is swapping in a new generation"""
+    for attempt in range(3):
+        try:
+            vectorstore = read_faiss_index(index_path)
+            break
+        except ValueError:
+            if attempt == 2:
+                raise
+            time.sleep(0.05)
+    # Queries are embedded at the index's dimension, which may be truncated
+    vectorstore.embedding_function = TruncatedEmbeddings(get_embedding_model(), vectorstore.index.d)
+    configure_faiss_index(vectorstore.index)
+    return vectorstore
+
+# In-flight loads, so concurrent queries (e.g. overlapping multi-notebook searches) read each index once
+vectorstore_loads: Dict[str, asyncio.Future] = {}
+
+async def get_vectorstore(session_id: str, evict: bool = True) -> VectorStore:
+    """
+    Return the vectorstore for a notebook, loading it from disk only on a cache miss.
+    With evict=False a loaded index is only cached if it fits in the cache's free room
+    """
+    # One stat of the live index file, so updates written by other worker processes are picked up
+    vectorstore = vectorstore_cache.get(session_id, index_version(session_id))
+    if vectorstore is not None:
+        return vectorstore
+    load = vectorstore_loads.get(session_id)
+    if load is None:
+        load = asyncio.ensure_future(load_and_cache_vectorstore(session_id, evict))
+        vectorstore_loads[session_id] = load
+        load.add_done_callback(lambda _: vectorstore_loads.pop(session_id, None))
+    # A cancelled query must not cancel a load other queries are waiting for
+    with stage("index_load"):
+        return await asyncio.shield(load)
+
+async def load_and_cache_vectorstore(session_id: str, evict: bool = True) -> VectorStore:
+    # Taken before loading: if the files are swapped meanwhile, the next lookup reloads the newer ones
+    version = await run_blocking(index_version, session_id)
+    vectorstore = await run_blocking(load_vectorstore, session_id)
+    await run_blocking(vectorstore_cache.put, session_id, vectorstore, version, evict)
+    return vectorstore
+
+def migrate_index_dir(index_path: Path, dtype: str) -> Optional[int]:
+    """Convert one FAISS notebook index to the memory-mapped format; returns chunks migrated, or None if skipped"""
+    if not (index_path / "index.faiss").exists():
+        return None
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    # Only stored vectors are read, so no embedding client (or API key) is needed
+    store = FAISS.load_local(str(index_path), UnavailableEmbeddings(), allow_dangerous_deserialization=True)
+    ntotal = store.index.ntotal
+    doc_ids = [store.index_to_docstore_id[i] for i in range(ntotal)]
+    documents = []
+    for doc_id in doc_ids:
+        doc = store.docstore.search(doc_id)
+        documents.append(Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata))
+    ivf = faiss.try_extract_index_ivf(store.index)
+    if ivf is not None:
+        # Quantized vectors are decoded; IVF lists need a direct map to reconstruct by position
+        ivf.make_direct_map()
+    vectors = store.index.reconstruct_n(0, ntotal) if ntotal else np.zeros((0, store.index.d), dtype=np.float32)
+    swap_in_mmap_index(index_path.name, documents, [vectors], store.index.d, dtype)
+    return ntotal
+
+def migrate_indexes_cli(argv: List[str]) -> int:
+    """python app.py migrate-index [--dtype float16] [notebook_id ...]"""
+    parser = argparse.ArgumentParser(
+        prog="python app.py migrate-index",
+        description="Convert FAISS notebook indexes under data/index to the memory-mapped format"
+    )
+    parser.add_argument("notebook_ids", nargs="*", help="notebooks to migrate (default: all)")
+    parser.add_argument("--dtype", choices=sorted(MMAP_DTYPE_CODES), default=INDEX_MMAP_DTYPE)
+    args = parser.parse_args(argv)
+    init_storage()
+
+    index_paths = [INDEX_DIR / notebook_id for notebook_id in args.notebook_ids] or sorted(
+        path for path in INDEX_DIR.iterdir() if path.is_dir() and not path.name.startswith(".")
+    )
+    failed = False
+    for index_path in index_paths:
+        try:
+            # Held like notebook_lock, so a running server's updates to this notebook wait for the migration
+            with open(notebook_lock_path(index_path.name), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                start_time = time.time()
+                migrated = migrate_index_dir(index_path, args.dtype)
+        except Exception as e:
+            failed = True
+            print(f"❌ {index_path.name}: {e}")
+            continue
+        if migrated is None:
+            print(f"⏭️  {index_path.name}: no FAISS index, skipped")
+        else:
+            print(f"✅ {index_path.name}: {migrated} chunks migrated in {time.time() - start_time:.2f}s")
+    return 1 if failed else 0
+
+# Lexical index
+# Per-notebook SQLite FTS5 index (lexical.sqlite next to the vector index) for BM25 retrieval of exact
+# terms such as part numbers, error codes and clause IDs. Rows carry the chunk id, text and metadata.
+LEXICAL_INDEX_FILE = "lexical.sqlite"
+LEXICAL_STOPWORDS = frozenset(
+    "a about an and any are as at be by can could do does for from has have how i if in is it its me "
+    "my of on or our please should tell that the their there this to was we what when where which who "
+    "why will with would you your".split()
+)
+LEXICAL_TERM_PATTERN = re.compile(r"[A-Za-z0-9](?:[\w\-./]*[A-Za-z0-9])?")
+
+def lexical_index_path(session_id: str) -> Path:
+    return INDEX_DIR / session_id / LEXICAL_INDEX_FILE
+
+def connect_lexical_index(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+        "text, chunk_id UNINDEXED, file_name UNINDEXED, metadata UNINDEXED)"
+    )
+    return conn
+
+def insert_lexical_rows(conn: sqlite3.Connection, chunks: Iterable[Document]):
+    conn.executemany(
+        "INSERT INTO chunks (text, chunk_id, file_name, metadata) VALUES (?, ?, ?, ?)",
+        (
+            (chunk.page_content, chunk.id, chunk.metadata.get('file_name'), json.dumps(chunk.metadata))
+            for chunk in chunks
+        )
+    )
+
+def add_to_lexical_index(session_id: str, chunks: List[Document]):
+    """Index new chunks (with ids) in the notebook's lexical index"""
+    with closing(connect_lexical_index(lexical_index_path(session_id))) as conn:
+        insert_lexical_rows(conn, chunks)
+        conn.commit()
+
+def remove_from_lexical_index(session_id: str, file_name: str):
+    with closing(connect_lexical_index(lexical_index_path(session_id))) as conn:
+        conn.execute("DELETE FROM chunks WHERE file_name = ?", (file_name,))
+        conn.commit()
+
+def build_lexical_index(session_id: str, vectorstore: VectorStore):
+    """(Re)build a notebook's lexical index from every chunk in its vectorstore"""
+    path = lexical_index_path(session_id)
+    tmp_path = path.with_name(f".{LEXICAL_INDEX_FILE}.{uuid.uuid4().hex}.tmp")
+    try:
+        with closing(connect_lexical_index(tmp_path)) as conn:
+            insert_lexical_rows(
+                conn,
+                (Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+                 for doc_id, doc in iter_chunks(vectorstore))
+            )
+            conn.commit()
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def lexical_terms(question: str) -> List[str]:
+    """Search terms of a question: words and identifiers such as AB-1000, E42 or 3.2.1, minus stopwords"""
+    return [term for term in LEXICAL_TERM_PATTERN.findall(question) if term.lower() not in LEXICAL_STOPWORDS]
+
+def is_identifier(term: str) -> bool:
+    """Part numbers, error codes and clause IDs: letters mixed with digits, or dotted numbers"""
+    has_digit = any(ch.isdigit() for ch in term)
+    return has_digit and (any(ch.isalpha() for ch in term) or "." in term)
+
+def question_identifiers(question: str) -> frozenset:
+    return frozenset(term.lower() for term in lexical_terms(question) if is_identifier(term))
+
+def lexical_search(session_id: str, question: str, k: int) -> List[tuple[Document, float]]:
+    """Top-k chunks by BM25 for any of the question's terms; scores are positive, higher is better"""
+    terms = lexical_terms(question)
+    if not terms:
+        return []
+    # Each term is an FTS5 phrase, so identifiers split by the tokenizer (AB-1000) still match exactly
+    query = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    with closing(sqlite3.connect(f"file:{lexical_index_path(session_id)}?mode=ro", uri=True)) as conn:
+        rows = conn.execute(
+            "SELECT chunk_id, text, metadata, bm25(chunks) AS rank FROM chunks WHERE chunks MATCH ? ORDER BY rank LIMIT ?",
+            (query, k)
+        ).fetchall()
+    return [
+        (Document(id=chunk_id, page_content=text, metadata=json.loads(metadata)), -rank)
+        for chunk_id, text, metadata, rank in rows
+    ]
+
+# Notebooks indexed before lexical indexes existed get one built in the background on first query
+lexical_backfills: Dict[str, asyncio.Task] = {}
+
+async def backfill_lexical_index(session_id: str):
+    try:
+        async with notebook_lock(session_id):
+            if not await run_blocking(lexical_index_path(session_id).exists):
+                vectorstore = await get_vectorstore(session_id)
+                await run_blocking(build_lexical_index, session_id, vectorstore)
+    except Exception as e:
+        print(f"Lexical index backfill failed for {session_id}: {e}")
+    finally:
+        lexical_backfills.pop(session_id, None)
+
+async def lexical_index_ready(session_id: str) -> bool:
+    """Whether the notebook's lexical index exists; schedules a backfill when it does not"""
+    if await run_blocking(lexical_index_path(session_id).exists):
+        return True
+    if session_id not in lexical_backfills:
+        lexical_backfills[session_id] = asyncio.create_task(backfill_lexical_index(session_id))
+    return False
+
+# Ingestion queue
+class IngestionQueue:
+    """
+    Bounded queue of PDF ingestion jobs processed by a fixed pool of worker tasks.
+    Recent jobs are kept in memory so clients can poll or stream their progress. Every change is
+    also handed to store in a blocking thread, one write per job at a time with the latest state,
+    so other worker processes can report the job too.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[IngestJob], Awaitable[None]],
+        store: Callable[[IngestJob], None],
+        workers: int,
+        max_size: int,
+        history: int
+    ):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.max_size = max_size
+        self.history = history
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._updates: Dict[str, asyncio.Event] = {}
+        self._versions: Dict[str, int] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stores: Dict[str, asyncio.Task] = {}
+        self._unstored: set = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.gather(*self._stores.values(), return_exceptions=True)
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job: IngestJob):
+        """Enqueue a job; raises asyncio.QueueFull when the queue is at capacity"""
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not running")
+        self._queue.put_nowait(job)
+        self.jobs[job.job_id] = job
+        self._updates[job.job_id] = asyncio.Event()
+        self._versions[job.job_id] = 0
+        while len(self.jobs) > self.history:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest.status not in ("ready", "failed"):
+                break
+            self.jobs.pop(oldest_id)
+            self._updates.pop(oldest_id, None)
+            self._versions.pop(oldest_id, None)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def update(self, job: IngestJob, **fields):
+        """Apply progress fields to a job and wake anyone streaming it"""
+        for key, value in fields.items():
+            setattr(job, key, value)
+        event = self._updates.get(job.job_id)
+        if event is not None:
+            self._versions[job.job_id] += 1
+            self._updates[job.job_id] = asyncio.Event()
+            event.set()
+        self._unstored.add(job.job_id)
+        if job.job_id not in self._stores:
+            self._stores[job.job_id] = asyncio.create_task(self._store(job))
+
+    async def _store(self, job: IngestJob):
+        # Updates arriving during a write are folded into the next one
+        try:
+            while job.job_id in self._unstored:
+                self._unstored.discard(job.job_id)
+                try:
+                    await run_blocking(self.store, job.copy())
+                except Exception as e:
+                    print(f"Saving ingestion job {job.job_id} failed: {e}")
+        finally:
+            self._stores.pop(job.job_id, None)
+
+    def version(self, job: IngestJob) -> int:
+        return self._versions.get(job.job_id, 0)
+
+    async def wait_for_update(self, job: IngestJob, seen_version: int, timeout: float) -> bool:
+        """Wait until the job changes after seen_version; returns False on timeout"""
+        event = self._updates.get(job.job_id)
+        if event is None or self.version(job) != seen_version:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.handler(job)
+            except Exception as e:
+                print(f"Ingestion job {job.job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+async def run_ingest_job(job: IngestJob):
     """
-    Process PDF using PyMuPDF4LLM with page-level chunking.
-    Returns FAISS vectorstore and number of chunks.
+    Parse, embed and index one uploaded PDF into its notebook.
+    A new notebook is marked ready or failed; a failed append leaves the notebook as it was.
     """
-    # Load PDF with page-level chunks
-    md_text = pymupdf4llm.to_markdown(file_path, page_chunks=True)
-
-    # Parse the markdown output to create documents with metadata
-    documents = []
-    current_page = 1
+    start_time = time.time()
+    trace = start_trace("ingest")
+    pdf_path = PDFS_DIR / job.session_id / job.filename
 
-    # Split by page markers if present
-    if isinstance(md_text, list):
-        # PyMuPDF4LLM returns list of dicts with page_chunks=True
-        for item in md_text:
-            page_num = item.get('metadata', {}).get('page', current_page)
-            text = item.get('text', '')
+    def progress(**fields):
+        if "chunks_total" in fields:
+            fields["status"] = "embedding"
+        ingestion_queue.update(job, **fields)
 
-            doc = Document(
-                page_content=text,
-                metadata={
-                    'file_name': os.path.basename(file_path),
-                    'page_number': page_num,
-                    'page_start': page_num,
-                    'page_end': page_num,
-                    'session_id': session_id
-                }
-            )
-            documents.append(doc)
-            current_page = page_num + 1
-    else:
-        # Fallback: single document
-        doc = Document(
-            page_content=md_text,
-            metadata={
-                'file_name': os.path.basename(file_path),
-                'page_number': 1,
-                'page_start': 1,
-                'page_end': 1,
-                'session_id': session_id
-            }
+    def finish(status: str, **fields):
+        processing_time = time.time() - start_time
+        metrics.observe("progression_ingest_seconds", processing_time, status=status)
+        ingestion_queue.update(
+            job, status=status, processing_time=processing_time, stages=trace.metadata()["stages"], **fields
         )
-        documents.append(doc)
 
-    # Split documents while preserving metadata
-    chunks = text_splitter.split_documents(documents)
+    def fail(error: str):
+        finish("failed", error=error)
 
-    # Create FAISS vectorstore
-    vectorstore = FAISS.from_documents(chunks, embedding_model)
+    ingestion_queue.update(job, status="parsing")
+    try:
+        # Uploads are hashed while streaming to disk; hash here only if the job did not carry one
+        content_sha256 = job.content_sha256 or await run_blocking(file_sha256, str(pdf_path))
+        ingestion_queue.update(job, content_sha256=content_sha256)
 
-    # Save index
-    index_path = INDEX_DIR / session_id
-    index_path.mkdir(exist_ok=True)
-    vectorstore.save_local(str(index_path))
+        existing_sources = await run_blocking(get_sources, job.session_id)
+        if any(source.content_sha256 == content_sha256 for source in existing_sources):
+            raise ValueError("This PDF is already part of the notebook")
 
-    return vectorstore, len(chunks)
+        # An identical PDF that is already indexed lets us skip parsing; its embeddings are cached
+        donor = await run_blocking(find_source_by_content_hash, content_sha256)
+        if donor:
+            donor_store = await get_vectorstore(donor[0])
+            chunks = await run_blocking(reuse_source_chunks, donor_store, donor[1], job.session_id, job.filename)
+            ingestion_queue.update(job, deduplicated_from=donor[0], chunks_total=len(chunks), status="embedding")
+            with stage("embedding"):
+                embeddings = await embed_texts([chunk.page_content for chunk in chunks], progress)
+        else:
+            chunks, embeddings = await process_pdf(str(pdf_path), job.session_id, progress)
 
-def load_vectorstore(session_id: str) -> FAISS:
-    """Load existing FAISS vectorstore"""
-    index_path = INDEX_DIR / session_id
-    if not index_path.exists():
-        raise HTTPException(status_code=404, detail="Notebook not found")
+        with stage("index_write"):
+            await add_chunks_to_notebook(job.session_id, chunks, embeddings)
+    except Exception as e:
+        if job.append:
+            await run_blocking(pdf_path.unlink, missing_ok=True)
+        else:
+            await run_blocking(set_notebook_status, job.session_id, "failed")
+        fail(f"PDF processing failed: {str(e)}")
+        return
 
-    return FAISS.load_local(
-        str(index_path),
-        embedding_model,
-        allow_dangerous_deserialization=True
-    )
+    num_chunks = len(chunks)
+    if not await run_blocking(finish_source_ingestion, job.session_id, job.filename, content_sha256, num_chunks):
+        # Notebook was deleted while indexing; drop what we just built
+        vectorstore_cache.invalidate(job.session_id)
+        answer_cache.invalidate(job.session_id)
+        await run_blocking(delete_notebook_files, job.session_id)
+        fail("Notebook was deleted during indexing")
+        return
+
+    finish("ready", chunks_total=num_chunks)
+
+def save_job(job: IngestJob):
+    save_job_record(job.job_id, current_worker(), job.status, job.created_at, job.json())
+
+ingestion_queue = IngestionQueue(run_ingest_job, save_job, INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_JOB_HISTORY)
 
 def build_pdf_sources(chunks: List[Document]) -> List[PdfSource]:
     """Build PDF sources list from retrieved chunks"""
@@ -242,51 +2866,246 @@ def build_pdf_sources(chunks: List[Document]) -> List[PdfSource]:
         page_start = metadata.get('page_start', metadata.get('page_number', 1))
         page_end = metadata.get('page_end', metadata.get('page_number', 1))
 
-        key = f"{file_name}:{page_start}-{page_end}"
+        notebook_id = metadata.get('notebook_id')
+        key = f"{notebook_id}:{file_name}:{page_start}-{page_end}"
         if key not in sources_dict:
             sources_dict[key] = PdfSource(
                 file_name=file_name,
                 page_start=page_start,
-                page_end=page_end
+                page_end=page_end,
+                notebook_id=notebook_id,
+                notebook_name=metadata.get('notebook_name')
             )
 
     # Return up to MAX_PDF_SOURCES
     return list(sources_dict.values())[:MAX_PDF_SOURCES]
 
-def perform_web_search(question: str) -> List[WebSource]:
-    """Perform web search using Tavily"""
-    try:
-        results = tavily_search.invoke({"query": question})
+# Context assembly
+# Neighbouring chunks share up to chunk_overlap (200) characters, or are separated by the whitespace the
+# splitter split on. Chunks without start offsets (older notebooks) merge on text overlaps of at least this
+CONTEXT_MIN_OVERLAP_CHARS = 20
+CONTEXT_MAX_GAP_CHARS = 2
+# Paragraphs at least this long are dropped when they already appeared earlier in the context
+CONTEXT_DEDUPE_MIN_CHARS = 40
+# A block is cut to fit the budget only if at least this many tokens of it still fit
+CONTEXT_MIN_TAIL_TOKENS = 50
 
-        # Normalize results to WebSource format
-        web_sources = []
+def text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is also a prefix of second, 0 below CONTEXT_MIN_OVERLAP_CHARS"""
+    probe = second[:CONTEXT_MIN_OVERLAP_CHARS]
+    if len(probe) < CONTEXT_MIN_OVERLAP_CHARS:
+        return 0
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+def merge_texts(first: str, second: str) -> Optional[str]:
+    """One text covering both when one contains or overlaps the other, else None"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = text_overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    overlap = text_overlap(second, first)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+def merge_page_chunks(chunks: List[Document]) -> List[str]:
+    """Merge chunks of one page that are adjacent, overlap or contain each other into contiguous blocks"""
+    if all('start_index' in chunk.metadata for chunk in chunks):
+        spans: List[list] = []
+        for chunk in sorted(chunks, key=lambda chunk: chunk.metadata['start_index']):
+            start = chunk.metadata['start_index']
+            end = start + len(chunk.page_content)
+            if spans and start <= spans[-1][1] + CONTEXT_MAX_GAP_CHARS:
+                previous_end, previous_text = spans[-1][1], spans[-1][2]
+                if end <= previous_end:
+                    continue
+                if start >= previous_end:
+                    # The splitter dropped the separator between the chunks (a paragraph or line break)
+                    spans[-1][2] = previous_text + "\n" * (start - previous_end) + chunk.page_content
+                else:
+                    spans[-1][2] = previous_text + chunk.page_content[previous_end - start:]
+                spans[-1][1] = end
+            else:
+                spans.append([start, end, chunk.page_content])
+        return [text for _, _, text in spans]
+
+    blocks: List[str] = []
+    for chunk in chunks:
+        pending = chunk.page_content.strip()
+        # A merged block may now reach another block, so keep merging until nothing overlaps
+        while True:
+            for i, block in enumerate(blocks):
+                merged = merge_texts(block, pending)
+                if merged is not None:
+                    del blocks[i]
+                    pending = merged
+                    break
+            else:
+                blocks.append(pending)
+                break
+    return blocks
 
-        # Tavily returns dict with 'results' key containing the list
-        if isinstance(results, dict):
-            results_list = results.get('results', [])
-        elif isinstance(results, list):
-            results_list = results
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text within max_tokens, found by bisection over characters"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
         else:
-            results_list = []
+            high = middle - 1
+    return text[:low]
+
+def build_context(chunks: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[str, Dict[str, Any]]:
+    """
+    Assemble the PDF context for the prompts from retrieved chunks (in relevance order).
+    Overlapping chunks of the same page are merged, paragraphs repeated across chunks are dropped,
+    and blocks are added in order of their best-ranked chunk until the token budget is spent.
+    Returns the context and statistics comparing it with joining the chunks as they are.
+    """
+    if not chunks:
+        return "", {"chunks": 0, "blocks": 0, "tokens": 0, "raw_tokens": 0, "tokens_saved": 0, "truncated": False}
+
+    pages: Dict[tuple, List[Document]] = {}
+    for chunk in chunks:
+        metadata = chunk.metadata
+        key = (metadata.get('notebook_id'), metadata.get('file_name'), metadata.get('page_start'), metadata.get('page_end'))
+        pages.setdefault(key, []).append(chunk)
+
+    seen_paragraphs = set()
+    blocks = []
+    for page_chunks in pages.values():
+        for block in merge_page_chunks(page_chunks):
+            paragraphs = []
+            for paragraph in block.split("\n\n"):
+                normalized = " ".join(paragraph.split())
+                if len(normalized) >= CONTEXT_DEDUPE_MIN_CHARS:
+                    if normalized in seen_paragraphs:
+                        continue
+                    seen_paragraphs.add(normalized)
+                paragraphs.append(paragraph)
+            if any(paragraph.strip() for paragraph in paragraphs):
+                blocks.append("\n\n".join(paragraphs))
+
+    included = []
+    tokens = 0
+    truncated = False
+    for block in blocks:
+        block_tokens = count_tokens(block)
+        if tokens + block_tokens <= token_budget:
+            included.append(block)
+            tokens += block_tokens
+            continue
+        truncated = True
+        remaining = token_budget - tokens
+        if remaining >= CONTEXT_MIN_TAIL_TOKENS:
+            tail = truncate_to_tokens(block, remaining)
+            included.append(tail)
+            tokens += count_tokens(tail)
+        break
+
+    context = "\n\n".join(included)
+    raw_tokens = count_tokens("\n\n".join(chunk.page_content for chunk in chunks))
+    return context, {
+        "chunks": len(chunks),
+        "blocks": len(included),
+        "tokens": tokens,
+        "raw_tokens": raw_tokens,
+        "tokens_saved": max(0, raw_tokens - tokens),
+        "truncated": truncated,
+    }
+
+def record_context_savings(gate_info: Dict[str, Any], context_info: Dict[str, Any], can_answer: bool):
+    """Add context statistics to the metadata, counting saved tokens once per prompt the context went into"""
+    prompts = (gate_info.get("gate") in ("llm", "llm_fallback")) + bool(can_answer)
+    gate_info["context"] = {**context_info, "prompt_tokens_saved": context_info["tokens_saved"] * prompts}
+
+def parse_web_results(results: Any) -> List[WebSource]:
+    """Normalize Tavily results to WebSource format"""
+    web_sources = []
+
+    # Tavily returns dict with 'results' key containing the list
+    if isinstance(results, dict):
+        results_list = results.get('results', [])
+    elif isinstance(results, list):
+        results_list = results
+    else:
+        results_list = []
+
+    for result in results_list[:MAX_WEB_SOURCES]:
+        if isinstance(result, dict):
+            web_sources.append(WebSource(
+                title=result.get('title', 'Untitled'),
+                url=result.get('url', ''),
+                snippet=result.get('content', result.get('snippet', ''))
+            ))
+
+    return web_sources
 
-        for result in results_list[:MAX_WEB_SOURCES]:
-            if isinstance(result, dict):
-                web_sources.append(WebSource(
-                    title=result.get('title', 'Untitled'),
-                    url=result.get('url', ''),
-                    snippet=result.get('content', result.get('snippet', ''))
-                ))
+# Upstream searches in flight, by cache key, so concurrent identical questions share one Tavily call
+web_searches: Dict[bytes, asyncio.Future] = {}
 
-        return web_sources
+async def search_web_upstream(question: str, key: bytes) -> List[WebSource]:
+    """Call Tavily once and cache the outcome; a failure is cached as no results with the failure TTL"""
+    web_cache.searches += 1
+    failed = False
+    try:
+        web_sources = parse_web_results(await get_tavily_search().ainvoke({"query": question}))
     except Exception as e:
         print(f"Web search error: {e}")
         import traceback
         traceback.print_exc()
-        return []
+        web_cache.failures += 1
+        web_sources, failed = [], True
 
-def check_answer_in_context(question: str, context: str) -> bool:
-    """Use LLM to check if the context contains information to answer the question"""
-    check_prompt = ChatPromptTemplate.from_template("""
+    if WEB_CACHE_ENABLED:
+        try:
+            await run_blocking(web_cache.put, key, [source.dict() for source in web_sources], failed)
+        except sqlite3.Error as e:
+            print(f"Web search cache write failed: {e}")
+    return web_sources
+
+async def perform_web_search(question: str, search_info: Optional[Dict[str, bool]] = None) -> List[WebSource]:
+    """
+    Perform web search using Tavily, answering from the web search cache when it can.
+    Concurrent searches for the same normalized question in this worker share one upstream call.
+    search_info, when given, gets "upstream" set once this search makes its own Tavily call (rather
+    than being answered from the cache or joining a search in flight).
+    Never raises: a failed search returns no results.
+    """
+    key = web_query_key(question)
+    with stage("web_search"):
+        if WEB_CACHE_ENABLED:
+            try:
+                cached = await run_blocking(web_cache.get, key)
+            except sqlite3.Error as e:
+                print(f"Web search cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                return [WebSource(**source) for source in cached]
+
+        search = web_searches.get(key)
+        if search is None:
+            search = asyncio.ensure_future(search_web_upstream(question, key))
+            web_searches[key] = search
+            search.add_done_callback(lambda _: web_searches.pop(key, None))
+            if search_info is not None:
+                search_info["upstream"] = True
+        else:
+            web_cache.coalesced += 1
+        # A cancelled caller (e.g. a speculative search the PDF made redundant) must not cancel
+        # the call other queries are waiting for; its result is still cached
+        return await asyncio.shield(search)
+
+relevance_check_prompt = ChatPromptTemplate.from_template("""
 You are evaluating whether the provided context contains sufficient information to answer the user's question.
 
 Context:
@@ -299,10 +3118,223 @@ Respond with ONLY "YES" if the context provides a clear answer, or "NO" if it do
 
 Response:""")
 
-    chain = check_prompt | llm | StrOutputParser()
-    response = chain.invoke({"context": context, "question": question}).strip().upper()
+def is_yes(response: str) -> bool:
+    return "YES" in response.strip().upper()
+
+async def check_answer_in_context(question: str, context: str) -> bool:
+    """Use LLM to check if the context contains information to answer the question"""
+    chain = relevance_check_prompt | get_llm() | StrOutputParser()
+    with stage("relevance_check"):
+        return is_yes(await chain.ainvoke({"context": context, "question": question}))
+
+async def decide_pdf_relevance(
+    question: str,
+    context: str,
+    scores: Optional[List[float]]
+) -> tuple[bool, Dict[str, Any]]:
+    """
+    Decide whether the retrieved chunks can answer the question.
+    The 'score' gate compares the mean cosine relevance of the chunks with CONFIDENCE_THRESHOLD
+    and only asks the LLM when RELEVANCE_LLM_FALLBACK is on and the score is within
+    RELEVANCE_BORDER_MARGIN of the threshold. The 'llm' gate always asks the LLM.
+    Returns the decision and metadata describing which gate made it.
+    """
+    can_answer, gate_info = score_gate(context, scores)
+    if can_answer is None:
+        can_answer = await check_answer_in_context(question, context)
+    return can_answer, gate_info
+
+def score_gate(context: str, scores: Optional[List[float]]) -> tuple[Optional[bool], Dict[str, Any]]:
+    """The relevance decision from scores alone, or None when the LLM has to decide (see decide_pdf_relevance)"""
+    if not context.strip():
+        return False, {"gate": "empty"}
+
+    # No scores means a lexical shortcut, which only saves the query embedding. The LLM gate still
+    # decides, and with the LLM fallback on it does too, since there is no score to place near the
+    # threshold; so the question can still fall back to the web. Otherwise the exact identifier match
+    # is the evidence: the notebook contains what was asked for
+    if scores is None:
+        if RELEVANCE_GATE == "llm":
+            return None, {"gate": "llm", "threshold": CONFIDENCE_THRESHOLD}
+        if RELEVANCE_LLM_FALLBACK:
+            return None, {"gate": "llm_fallback", "threshold": CONFIDENCE_THRESHOLD}
+        return True, {"gate": "lexical", "threshold": CONFIDENCE_THRESHOLD}
+
+    relevance = sum(scores) / len(scores) if scores else 0.0
+    gate_info = {
+        "gate": RELEVANCE_GATE,
+        "relevance_score": round(relevance, 4),
+        "top_score": round(max(scores), 4) if scores else 0.0,
+        "threshold": CONFIDENCE_THRESHOLD,
+    }
+
+    if RELEVANCE_GATE == "llm":
+        return None, gate_info
+
+    if RELEVANCE_LLM_FALLBACK and abs(relevance - CONFIDENCE_THRESHOLD) <= RELEVANCE_BORDER_MARGIN:
+        gate_info["gate"] = "llm_fallback"
+        return None, gate_info
+
+    return relevance >= CONFIDENCE_THRESHOLD, gate_info
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Document]:
+    """Merge ranked lists by summing 1 / (RRF_K + rank) per chunk id; returns the top k chunks"""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+def matched_identifiers(question: str, lexical_hits: List[tuple[Document, float]]) -> List[str]:
+    """The question's identifiers if it has any and the top BM25 hit contains all of them"""
+    identifiers = [term for term in lexical_terms(question) if is_identifier(term)]
+    if not identifiers or not lexical_hits:
+        return []
+    top_text = lexical_hits[0][0].page_content.lower()
+    return identifiers if all(identifier.lower() in top_text for identifier in identifiers) else []
+
+async def lexical_candidates(session_id: str, question: str) -> List[tuple[Document, float]]:
+    """BM25 hits for hybrid retrieval; none in 'dense' mode or while the lexical index is missing"""
+    if RETRIEVAL_MODE != "hybrid" or not await lexical_index_ready(session_id):
+        return []
+    with stage("lexical_search"):
+        return await run_blocking(lexical_search, session_id, question, HYBRID_FETCH_K)
+
+async def embed_question(embeddings: Embeddings, question: str) -> List[float]:
+    """Embed a question for search, timed as the query_embedding stage"""
+    with stage("query_embedding"):
+        query_vector = await embeddings.aembed_query(question)
+    metrics.inc("progression_embedding_tokens_total", count_tokens(question), purpose="query")
+    return query_vector
+
+def index_query_vector(vectorstore: VectorStore, query_vector: List[float]) -> List[float]:
+    """A full-dimension query vector cut to the index's dimension, since notebooks may store truncated vectors"""
+    dims = getattr(vectorstore.embeddings, "dims", None)
+    return truncate_embeddings([query_vector], dims)[0].tolist()
+
+async def dense_search(
+    vectorstore: VectorStore,
+    question: str,
+    k: int,
+    query_vector: Optional[List[float]] = None
+) -> List[tuple[Document, float]]:
+    """Vector search with cosine relevance scores, embedding the question unless its vector is given"""
+    if query_vector is None:
+        query_vector = await embed_question(vectorstore.embeddings, question)
+    relevance_score_fn = vectorstore._select_relevance_score_fn()
+    with stage("vector_search"):
+        results = await run_blocking(vectorstore.similarity_search_with_score_by_vector, query_vector, k)
+    return [(doc, relevance_score_fn(score)) for doc, score in results]
+
+async def retrieve_chunks(
+    session_id: str,
+    vectorstore: VectorStore,
+    question: str,
+    lexical_hits: Optional[List[tuple[Document, float]]] = None,
+    query_vector: Optional[List[float]] = None
+) -> tuple[List[Document], Optional[List[float]], Dict[str, Any]]:
+    """
+    Retrieve RETRIEVAL_K chunks for a question.
+    'dense' mode uses vector search only. 'hybrid' fuses BM25 hits from the notebook's lexical index
+    with vector hits by reciprocal rank fusion. With LEXICAL_SHORTCUT, a question whose identifiers
+    (part numbers, error codes, clause IDs) all appear in the top BM25 hit is answered from BM25
+    alone, skipping the query embedding call.
+    Batch queries and the answer cache lookup pass BM25 hits and question vectors they already computed.
+    Returns the chunks, the vector relevance scores of the top RETRIEVAL_K vector hits for the gate
+    (None after a lexical shortcut), and retrieval metadata.
+    """
+    if lexical_hits is None:
+        lexical_hits = await lexical_candidates(session_id, question)
+    identifiers = matched_identifiers(question, lexical_hits) if LEXICAL_SHORTCUT else []
+    if identifiers:
+        return [doc for doc, _ in lexical_hits[:RETRIEVAL_K]], None, {
+            "mode": "lexical",
+            "identifiers": identifiers,
+            "lexical_hits": len(lexical_hits),
+            "dense_hits": 0,
+            "embedding_skipped": True,
+        }
+
+    fetch_k = HYBRID_FETCH_K if lexical_hits else RETRIEVAL_K
+    dense_results = await dense_search(vectorstore, question, fetch_k, query_vector)
+    scores = [score for _, score in dense_results[:RETRIEVAL_K]]
+    info = {
+        "mode": "hybrid" if lexical_hits else "dense",
+        "lexical_hits": len(lexical_hits),
+        "dense_hits": len(dense_results),
+        "embedding_skipped": False,
+    }
+    if not lexical_hits:
+        return [doc for doc, _ in dense_results[:RETRIEVAL_K]], scores, info
+
+    chunks = reciprocal_rank_fusion(
+        [[doc for doc, _ in dense_results], [doc for doc, _ in lexical_hits]],
+        RETRIEVAL_K
+    )
+    return chunks, scores, info
+
+async def retrieve_across_notebooks(
+    session_ids: Optional[List[str]],
+    question: str
+) -> tuple[List[Document], List[float], Dict[str, Any]]:
+    """
+    Retrieve RETRIEVAL_K chunks across several notebooks (every ready notebook when session_ids is None).
+    The question is embedded once and the notebooks are searched MULTI_QUERY_BATCH_SIZE at a time, in
+    parallel within a batch, keeping the best RETRIEVAL_K hits so far. Cached indexes are searched in
+    place; a miss is cached only if it fits in the cache's free room, so a query over more notebooks than
+    the cache holds never evicts the notebooks in use (or its own earlier batches) and memory stays
+    bounded by the batch. Results are merged by cosine relevance, which is comparable across
+    notebooks (unlike BM25 or fused ranks, so this mode is vector-only).
+    Chunks are tagged with their notebook for attribution; notebooks that cannot be searched
+    (unknown, still indexing) are skipped and reported.
+    """
+    if session_ids is None:
+        names = await run_blocking(get_notebook_names)
+        session_ids = list(names)
+    else:
+        session_ids = list(dict.fromkeys(session_ids))
+        if len(session_ids) > MULTI_QUERY_MAX_NOTEBOOKS:
+            raise HTTPException(status_code=400, detail=f"At most {MULTI_QUERY_MAX_NOTEBOOKS} notebooks per query")
+        names = await run_blocking(get_notebook_names, session_ids)
+
+    query_vector = await embed_question(get_embedding_model(), question)
+
+    async def search(session_id: str) -> List[tuple[Document, float]]:
+        vectorstore = await get_vectorstore(session_id, evict=False)
+        return await dense_search(vectorstore, question, RETRIEVAL_K, index_query_vector(vectorstore, query_vector))
+
+    top: List[tuple[Document, float]] = []
+    skipped = []
+    dense_hits = 0
+    batch_size = max(1, MULTI_QUERY_BATCH_SIZE)
+    for start in range(0, len(session_ids), batch_size):
+        batch = session_ids[start:start + batch_size]
+        results = await asyncio.gather(*(search(session_id) for session_id in batch), return_exceptions=True)
+        for session_id, result in zip(batch, results):
+            if isinstance(result, Exception):
+                skipped.append(session_id)
+                continue
+            dense_hits += len(result)
+            for doc, score in result:
+                metadata = {**doc.metadata, "notebook_id": session_id, "notebook_name": names.get(session_id)}
+                top.append((Document(id=doc.id, page_content=doc.page_content, metadata=metadata), score))
+        top.sort(key=lambda item: item[1], reverse=True)
+        del top[RETRIEVAL_K:]
+    if len(skipped) == len(session_ids):
+        raise HTTPException(status_code=404, detail="No searchable notebooks")
 
-    return "YES" in response
+    return [doc for doc, _ in top], [score for _, score in top], {
+        "mode": "multi_notebook",
+        "notebooks_searched": len(session_ids) - len(skipped),
+        "notebooks_skipped": skipped,
+        "notebooks_matched": len({doc.metadata["notebook_id"] for doc, _ in top}),
+        "lexical_hits": 0,
+        "dense_hits": dense_hits,
+        "embedding_skipped": False,
+    }
 
 # LLM Prompts
 answer_prompt = ChatPromptTemplate.from_template("""
@@ -346,176 +3378,867 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
-@app.post("/api/v1/upload", response_model=UploadResponse)
+@app.get("/api/v1/ready")
+async def readiness_check():
+    """Readiness probe: 200 once this worker's startup warm-up has finished, 503 until then or if it failed"""
+    status = "ready" if startup_state["ready"] else "failed" if startup_state["error"] else "starting"
+    return JSONResponse(status_code=200 if status == "ready" else 503, content={"status": status, **startup_state})
+
+@app.get("/api/v1/stats")
+async def get_stats():
+    """Cache statistics for this worker process"""
+    return {
+        "success": True,
+        "worker": {"pid": os.getpid(), "workers": WORKERS, "shared_indexes": SHARED_INDEXES},
+        "index_cache": vectorstore_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "web_cache": web_cache.stats(),
+        "embedding_scheduler": embedding_scheduler.stats(),
+        "speculative_web_search": speculation_stats,
+        "ingestion": {
+            "workers": ingestion_queue.workers,
+            "queue_depth": ingestion_queue.depth(),
+            "queue_size": ingestion_queue.max_size,
+        }
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms, token counts and cache counters of this worker process, in the Prometheus text format"""
+    index_cache = vectorstore_cache.stats()
+    answers = answer_cache.stats()
+    embeddings = embedding_cache.stats()
+    web = web_cache.stats()
+    scheduler = embedding_scheduler.stats()
+    lines = metrics.render()
+    lines += prometheus_family("progression_cache_hits_total", "counter", "Cache hits", [
+        ({"cache": "index"}, index_cache["hits"]),
+        ({"cache": "answer"}, answers["hits"]),
+        ({"cache": "embedding"}, embeddings["hits"]),
+        ({"cache": "web"}, web["hits"] + web["failure_hits"]),
+    ])
+    lines += prometheus_family("progression_cache_misses_total", "counter", "Cache misses", [
+        ({"cache": "index"}, index_cache["misses"]),
+        ({"cache": "answer"}, answers["misses"]),
+        ({"cache": "embedding"}, embeddings["misses"]),
+        ({"cache": "web"}, web["misses"]),
+    ])
+    lines += prometheus_family("progression_cache_evictions_total", "counter", "Cache evictions", [
+        ({"cache": "index"}, index_cache["evictions"]),
+        ({"cache": "answer"}, answers["evictions"]),
+        ({"cache": "web"}, web["evictions"]),
+    ])
+    lines += prometheus_family("progression_web_searches_total", "counter", "Web searches by how they were answered", [
+        ({"outcome": "upstream"}, web["upstream_searches"] - web["upstream_failures"]),
+        ({"outcome": "failed"}, web["upstream_failures"]),
+        ({"outcome": "coalesced"}, web["coalesced"]),
+        ({"outcome": "cached"}, web["hits"]),
+        ({"outcome": "cached_failure"}, web["failure_hits"]),
+    ])
+    lines += prometheus_family("progression_cache_entries", "gauge", "Cached entries", [
+        ({"cache": "index"}, index_cache["entries"]),
+        ({"cache": "answer"}, answers["entries"]),
+    ])
+    lines += prometheus_family("progression_index_cache_bytes", "gauge", "Estimated memory of cached indexes", [
+        ({}, index_cache["bytes"]),
+    ])
+    lines += prometheus_family("progression_embedding_requests_total", "counter", "Ingestion embedding API requests", [
+        ({}, scheduler["requests"]),
+    ])
+    lines += prometheus_family("progression_embedding_retries_total", "counter", "Retried ingestion embedding requests", [
+        ({}, scheduler["retries"]),
+    ])
+    lines += prometheus_family("progression_speculative_web_searches_total", "counter", "Speculative web searches, by outcome", [
+        ({"outcome": "used"}, speculation_stats["searches_used"]),
+        ({"outcome": "wasted"}, speculation_stats["searches_wasted"]),
+    ])
+    lines += prometheus_family("progression_ingest_queue_depth", "gauge", "Ingestion jobs waiting for a worker", [
+        ({}, ingestion_queue.depth()),
+    ])
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def queue_full_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Ingestion queue is full, please retry later",
+        headers={"Retry-After": "30"}
+    )
+
+async def save_upload(session_id: str, pdf: UploadFile) -> tuple[str, str]:
+    """
+    Stream an uploaded PDF to the notebook's directory in fixed-size chunks, hashing it on the way.
+    Memory use is one chunk regardless of file size. Content must start like a PDF (%PDF- within
+    the first 1024 bytes) and stay under MAX_UPLOAD_MB; otherwise nothing is kept.
+    Returns the stored file name and its SHA-256.
+    """
+    file_name = os.path.basename(pdf.filename or "")
+    if not file_name:
+        raise HTTPException(status_code=400, detail="Missing file name")
+
+    session_pdf_dir = PDFS_DIR / session_id
+    await run_blocking(session_pdf_dir.mkdir, exist_ok=True)
+
+    # Write to a temporary name so a partial upload never looks like a source
+    part_path = session_pdf_dir / f".{file_name}.{uuid.uuid4().hex}.part"
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(part_path, "wb") as f:
+            while chunk := await pdf.read(UPLOAD_CHUNK_BYTES):
+                if size == 0 and PDF_MAGIC not in chunk[:1024]:
+                    raise HTTPException(status_code=400, detail="Only PDF files are supported")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise upload_too_large_error()
+                digest.update(chunk)
+                await run_blocking(f.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        await run_blocking(os.replace, part_path, session_pdf_dir / file_name)
+    except BaseException:
+        await run_blocking(part_path.unlink, missing_ok=True)
+        raise
+    return file_name, digest.hexdigest()
+
+async def enqueue_ingestion(session_id: str, file_name: str, content_sha256: str, append: bool) -> IngestJob:
+    """Queue ingestion of a saved PDF; raises asyncio.QueueFull"""
+    job = IngestJob(
+        job_id=str(uuid.uuid4()),
+        session_id=session_id,
+        filename=file_name,
+        append=append,
+        content_sha256=content_sha256,
+        created_at=datetime.utcnow().isoformat()
+    )
+    # Saved before it can run, so a poll through any worker finds the job from the start
+    await run_blocking(save_job, job)
+    try:
+        ingestion_queue.submit(job)
+    except asyncio.QueueFull:
+        await run_blocking(delete_job_record, job.job_id)
+        raise
+    return job
+
+@app.post("/api/v1/upload", response_model=UploadResponse, status_code=202)
 async def upload_pdf(
     name: str = Form(...),
     pdf: UploadFile = File(...)
 ):
-    """Upload a PDF and create a notebook"""
+    """Upload a PDF and create a notebook; indexing continues in the background"""
     start_time = time.time()
 
-    # Validate file type
-    if not pdf.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    # Backpressure: refuse early instead of buffering uploads we cannot index soon
+    if ingestion_queue.full():
+        raise queue_full_error()
 
     # Generate session ID
     session_id = str(uuid.uuid4())
 
-    # Create session directory
-    session_pdf_dir = PDFS_DIR / session_id
-    session_pdf_dir.mkdir(exist_ok=True)
+    try:
+        file_name, content_sha256 = await save_upload(session_id, pdf)
+    except BaseException:
+        await run_blocking(delete_notebook_files, session_id)
+        raise
 
-    # Save PDF
-    pdf_path = session_pdf_dir / pdf.filename
-    with open(pdf_path, "wb") as f:
-        content = await pdf.read()
-        f.write(content)
+    # Save to database; the notebook stays 'indexing' until its job finishes
+    await run_blocking(insert_notebook, session_id, name, "indexing", current_worker())
 
-    # Process PDF
     try:
-        vectorstore, num_chunks = process_pdf(str(pdf_path), session_id)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PDF processing failed: {str(e)}")
-
-    # Save to database
-    insert_notebook(session_id, name)
+        job = await enqueue_ingestion(session_id, file_name, content_sha256, append=False)
+    except asyncio.QueueFull:
+        await run_blocking(delete_notebook_record, session_id)
+        await run_blocking(delete_notebook_files, session_id)
+        raise queue_full_error()
 
     processing_time = time.time() - start_time
 
     return UploadResponse(
         session_id=session_id,
-        filename=pdf.filename,
-        num_chunks=num_chunks,
+        job_id=job.job_id,
+        filename=job.filename,
         processing_time=processing_time
     )
 
-@app.post("/api/v1/query", response_model=QueryResponse)
-async def query_notebook(request: QueryRequest):
-    """Query a notebook with RAG + web fallback"""
+@app.get("/api/v1/notebooks/{notebook_id}/sources")
+async def list_sources(notebook_id: str):
+    """List the PDFs of a notebook"""
+    if await run_blocking(get_notebook_status, notebook_id) is None:
+        raise HTTPException(status_code=404, detail="Notebook not found")
+    sources = await run_blocking(get_sources, notebook_id)
+    return {"success": True, "sources": [source.dict() for source in sources]}
+
+@app.post("/api/v1/notebooks/{notebook_id}/sources", response_model=UploadResponse, status_code=202)
+async def add_source(notebook_id: str, pdf: UploadFile = File(...)):
+    """Add a PDF to an existing notebook; only its chunks are embedded and merged into the index"""
     start_time = time.time()
 
-    # Load vectorstore
+    status = await run_blocking(get_notebook_status, notebook_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Notebook not found")
+    if status != "ready":
+        raise HTTPException(status_code=409, detail=f"Notebook is {status}")
+
+    file_name = os.path.basename(pdf.filename or "")
+    if file_name and (PDFS_DIR / notebook_id / file_name).exists():
+        raise HTTPException(status_code=409, detail=f"Notebook already has a source named {file_name}")
+
+    if ingestion_queue.full():
+        raise queue_full_error()
+
+    file_name, content_sha256 = await save_upload(notebook_id, pdf)
+    try:
+        job = await enqueue_ingestion(notebook_id, file_name, content_sha256, append=True)
+    except asyncio.QueueFull:
+        await run_blocking((PDFS_DIR / notebook_id / file_name).unlink, missing_ok=True)
+        raise queue_full_error()
+
+    return UploadResponse(
+        session_id=notebook_id,
+        job_id=job.job_id,
+        filename=job.filename,
+        processing_time=time.time() - start_time
+    )
+
+@app.delete("/api/v1/notebooks/{notebook_id}/sources/{file_name}")
+async def delete_source(notebook_id: str, file_name: str):
+    """Remove one PDF from a notebook without re-embedding the others"""
+    file_name = os.path.basename(file_name)
+    sources = await run_blocking(get_sources, notebook_id)
+    if not any(source.file_name == file_name for source in sources):
+        raise HTTPException(status_code=404, detail="Source not found")
+    if len(sources) == 1:
+        raise HTTPException(status_code=400, detail="Cannot remove the only source; delete the notebook instead")
+
+    chunks_removed = await remove_source_from_notebook(notebook_id, file_name)
+    await run_blocking(delete_source_record, notebook_id, file_name)
+    await run_blocking((PDFS_DIR / notebook_id / file_name).unlink, missing_ok=True)
+
+    return {"success": True, "message": "Source removed", "chunks_removed": chunks_removed}
+
+def load_job(job_id: str) -> Optional[IngestJob]:
+    """A job run by another worker process, failed first if that worker is gone"""
+    record = get_job_record(job_id)
+    if record is None:
+        return None
+    job, owner = record
+    if job.status not in ("ready", "failed") and not worker_alive(owner):
+        fail_interrupted_notebooks()
+        job = get_job_record(job_id)[0]
+    return job
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the progress of an ingestion job, whichever worker process runs it"""
+    job = ingestion_queue.get(job_id) or await run_blocking(load_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": job.dict()}
+
+# Jobs run by another worker process are streamed by polling the database
+JOB_POLL_INTERVAL = 0.5
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    """Stream ingestion progress as Server-Sent Events until the job is ready or failed"""
+    job = ingestion_queue.get(job_id)
+    stored_job = None if job is not None else await run_blocking(load_job, job_id)
+    if job is None and stored_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        while True:
+            version = ingestion_queue.version(job)
+            yield f"data: {job.json()}\n\n"
+            if job.status in ("ready", "failed"):
+                return
+            # Periodic heartbeat keeps proxies from closing an idle stream
+            while not await ingestion_queue.wait_for_update(job, version, timeout=15):
+                yield ": keep-alive\n\n"
+
+    async def stored_event_stream():
+        current = stored_job
+        last_sent = time.monotonic()
+        yield f"data: {current.json()}\n\n"
+        while current.status not in ("ready", "failed"):
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            polled = await run_blocking(load_job, job_id)
+            if polled is None:
+                return
+            if polled != current:
+                current = polled
+                last_sent = time.monotonic()
+                yield f"data: {current.json()}\n\n"
+            elif time.monotonic() - last_sent >= 15:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream() if job is not None else stored_event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+# Speculative web search accounting for this worker process
+speculation_stats = {
+    "speculative_queries": 0,
+    "searches_used": 0,
+    "searches_wasted": 0,
+    "latency_saved_seconds": 0.0,
+}
+
+async def timed_web_search(question: str, search_info: Dict[str, bool]) -> tuple[List[WebSource], float, bool]:
+    """
+    Run the web search and return its results, the time it finished and whether it made its own
+    upstream call. search_info carries the latter while the search runs, for callers that stop waiting
+    """
+    web_sources = await perform_web_search(question, search_info)
+    return web_sources, time.time(), search_info.get("upstream", False)
+
+async def plan_answer(
+    request: QueryRequest,
+    query_vector: Optional[List[float]] = None,
+    lexical_hits: Optional[List[tuple[Document, float]]] = None
+) -> Dict[str, Any]:
+    """
+    Run everything that happens before answer generation: retrieval, the relevance gate and,
+    when the PDF cannot answer, the web search.
+    In speculative mode the web search starts alongside retrieval and is abandoned if the PDF wins;
+    a Tavily call it already made finishes in the background and is cached (see perform_web_search).
+    Multi-notebook requests (session_ids or all_notebooks) retrieve across notebooks instead.
+    query_vector and lexical_hits are the question's embedding and BM25 hits when the answer cache
+    lookup already computed them.
+    Returns the answer prompt and inputs together with the sources and metadata to report.
+    """
+    multi_notebook = request.session_ids is not None or request.all_notebooks
+    if multi_notebook == (request.session_id is not None):
+        raise HTTPException(status_code=400, detail="Provide either session_id or session_ids / all_notebooks")
+
+    speculative = SPECULATIVE_WEB_SEARCH if request.speculative is None else request.speculative
+    web_task = None
+    web_started = time.time()
+    web_search_info: Dict[str, bool] = {}
+    if speculative:
+        web_task = asyncio.create_task(timed_web_search(request.question, web_search_info))
+        speculation_stats["speculative_queries"] += 1
+
+    try:
+        return await _plan_answer(request, web_task, web_search_info, web_started, query_vector, lexical_hits)
+    finally:
+        # Covers the PDF path and errors: never leave a speculative search running
+        if web_task is not None and not web_task.done():
+            web_task.cancel()
+
+async def _plan_answer(
+    request: QueryRequest,
+    web_task: Optional[asyncio.Task],
+    web_search_info: Dict[str, bool],
+    web_started: float,
+    query_vector: Optional[List[float]],
+    lexical_hits: Optional[List[tuple[Document, float]]]
+) -> Dict[str, Any]:
+    if request.session_id is None:
+        session_ids = None if request.all_notebooks else request.session_ids
+        chunks, scores, retrieval_info = await retrieve_across_notebooks(session_ids, request.question)
+    else:
+        vectorstore = await load_query_vectorstore(request.session_id)
+        # Retrieve top-k chunks (hybrid BM25 + vectors by default) with their cosine relevance
+        if query_vector is not None:
+            query_vector = index_query_vector(vectorstore, query_vector)
+        chunks, scores, retrieval_info = await retrieve_chunks(
+            request.session_id, vectorstore, request.question, lexical_hits, query_vector
+        )
+
+    # Build a deduplicated, token-budgeted context from the chunks
+    with stage("context_build"):
+        context, context_info = await run_blocking(build_context, chunks)
+
+    # Check if context can answer the question (score gate, LLM only when configured)
+    can_answer_from_pdf, gate_info = await decide_pdf_relevance(request.question, context, scores)
+    gate_info["retrieval"] = retrieval_info
+    record_context_savings(gate_info, context_info, can_answer_from_pdf)
+    gate_done = time.time()
+
+    # Decision: PDF vs Web
+    if can_answer_from_pdf:
+        if web_task is not None:
+            # Only a Tavily call this query made itself was paid for; a cache hit or a joined search was not.
+            # Abandoning the task does not stop that call, it finishes and is cached
+            upstream_call = web_search_info.get("upstream", False)
+            if upstream_call:
+                speculation_stats["searches_wasted"] += 1
+            gate_info["speculation"] = {
+                "used": False,
+                "upstream_call": upstream_call,
+                "extra_searches": int(upstream_call),
+                "latency_saved": 0.0,
+            }
+        return pdf_answer_plan(request.question, chunks, context, gate_info)
+
+    # Fallback to web search
+    if web_task is not None:
+        web_sources, web_finished, upstream_call = await web_task
+        # Only the part of the search that overlapped retrieval and the gate was saved
+        latency_saved = max(0.0, min(web_finished, gate_done) - web_started)
+        speculation_stats["searches_used"] += 1
+        speculation_stats["latency_saved_seconds"] += latency_saved
+        gate_info["speculation"] = {
+            "used": True,
+            "upstream_call": upstream_call,
+            "extra_searches": 0,
+            "latency_saved": latency_saved,
+        }
+    else:
+        web_sources = await perform_web_search(request.question)
+
+    return web_answer_plan(request.question, web_sources, gate_info)
+
+async def load_query_vectorstore(session_id: str) -> VectorStore:
     try:
-        vectorstore = load_vectorstore(request.session_id)
+        return await get_vectorstore(session_id)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load notebook: {str(e)}")
 
-    # Retrieve top-k chunks
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    chunks = retriever.invoke(request.question)
+def pdf_answer_plan(
+    question: str,
+    chunks: List[Document],
+    context: str,
+    gate_info: Dict[str, Any]
+) -> Dict[str, Any]:
+    return {
+        "source": "pdf",
+        "prompt": answer_prompt,
+        "inputs": {"context": context, "question": question},
+        "pdf_sources": build_pdf_sources(chunks),
+        "web_sources": None,
+        "chunks_used": len(chunks),
+        "metadata": {"model": "gpt-4o-mini", "can_answer": True, **gate_info},
+    }
 
-    # Build context from chunks
-    context = "\n\n".join([chunk.page_content for chunk in chunks]) if chunks else ""
+def web_answer_plan(question: str, web_sources: List[WebSource], gate_info: Dict[str, Any]) -> Dict[str, Any]:
+    if not web_sources:
+        raise HTTPException(
+            status_code=404,
+            detail="No information found in PDF and web search failed"
+        )
 
-    # Check if context can answer the question using LLM
-    can_answer_from_pdf = False
-    if context.strip():
-        can_answer_from_pdf = check_answer_in_context(request.question, context)
+    web_context = "\n\n".join([
+        f"Title: {src.title}\nURL: {src.url}\nContent: {src.snippet}"
+        for src in web_sources
+    ])
 
-    # Decision: PDF vs Web
-    if can_answer_from_pdf:
-        # Answer from PDF
-        chain = answer_prompt | llm | StrOutputParser()
-        answer = chain.invoke({"context": context, "question": request.question})
+    return {
+        "source": "web",
+        "prompt": web_answer_prompt,
+        "inputs": {"question": question, "web_context": web_context},
+        "pdf_sources": None,
+        "web_sources": web_sources,
+        "chunks_used": None,
+        "metadata": {"model": "gpt-4o-mini", "can_answer": False, **gate_info},
+    }
 
-        pdf_sources = build_pdf_sources(chunks)
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        processing_time = time.time() - start_time
+def stream_answer(
+    plan: Dict[str, Any],
+    start_time: float,
+    on_complete: Optional[Callable[[str, float], None]] = None
+) -> StreamingResponse:
+    """
+    Stream an answer as Server-Sent Events: 'sources' first, then one 'token' event per
+    generated chunk, then 'done' with timings ('error' if generation fails midway).
+    The request's trace (plan["trace"]) gets the answer_generation stage and token counts.
+    on_complete receives the full answer and processing time once generation succeeds.
+    """
+    async def event_stream():
+        # The response streams in its own task; record generation into the request's trace
+        current_trace.set(plan["trace"])
+        yield sse_event("sources", {
+            "source": plan["source"],
+            "pdf_sources": [src.dict() for src in plan["pdf_sources"]] if plan["pdf_sources"] else None,
+            "web_sources": [src.dict() for src in plan["web_sources"]] if plan["web_sources"] else None,
+            "chunks_used": plan["chunks_used"],
+        })
+
+        generation_start = time.time()
+        first_token_time = None
+        tokens = []
+        chain = plan["prompt"] | get_llm() | StrOutputParser()
+        try:
+            with stage("answer_generation"):
+                async for token in chain.astream(plan["inputs"]):
+                    if not token:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        end_time = time.time()
+        metrics.observe("progression_query_seconds", end_time - start_time, source=plan["source"])
+        plan["metadata"].update(plan["trace"].metadata())
+        if on_complete is not None:
+            on_complete("".join(tokens), end_time - start_time)
+        yield sse_event("done", {
+            "processing_time": end_time - start_time,
+            "timings": {
+                "time_to_sources": generation_start - start_time,
+                "time_to_first_token": (first_token_time or end_time) - start_time,
+                "generation": end_time - generation_start,
+            },
+            "metadata": plan["metadata"],
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_cached_answer(response: QueryResponse) -> StreamingResponse:
+    """Replay a cached answer in the streaming format: sources, the whole answer as one token, done"""
+    async def event_stream():
+        yield sse_event("sources", {
+            "source": response.source,
+            "pdf_sources": [src.dict() for src in response.pdf_sources] if response.pdf_sources else None,
+            "web_sources": [src.dict() for src in response.web_sources] if response.web_sources else None,
+            "chunks_used": response.chunks_used,
+        })
+        yield sse_event("token", {"text": response.answer})
+        yield sse_event("done", {
+            "processing_time": response.processing_time,
+            "timings": {
+                "time_to_sources": response.processing_time,
+                "time_to_first_token": response.processing_time,
+                "generation": 0.0,
+            },
+            "metadata": response.metadata,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def answer_response(plan: Dict[str, Any], answer: str, processing_time: float) -> QueryResponse:
+    return QueryResponse(
+        answer=answer,
+        source=plan["source"],
+        pdf_sources=plan["pdf_sources"],
+        web_sources=plan["web_sources"],
+        chunks_used=plan["chunks_used"],
+        processing_time=processing_time,
+        metadata=plan["metadata"]
+    )
+
+async def lookup_answer_cache(
+    request: QueryRequest,
+    start_time: float
+) -> tuple[Optional[QueryResponse], Optional[List[float]], Optional[tuple[int, int]], Optional[List[tuple[Document, float]]]]:
+    """
+    Look a single-notebook question up in the answer cache, by exact text first and then by embedding.
+    The BM25 search runs first: a question the lexical shortcut will answer is only looked up by exact
+    text, since embedding it would spend the call the shortcut saves.
+    Returns the cached response on a hit; on a miss, the question's embedding (None after a shortcut),
+    the index version to cache the new answer under and the BM25 hits, all reused for retrieval.
+    All but the response are None when caching does not apply.
+    """
+    if not (ANSWER_CACHE_ENABLED and request.cache and request.session_id):
+        return None, None, None, None
+    version = await run_blocking(index_version, request.session_id)
+    if version is None:
+        # Unknown or still indexing; retrieval reports the error
+        return None, None, None, None
+
+    lexical_hits = await lexical_candidates(request.session_id, request.question)
+    shortcut = LEXICAL_SHORTCUT and bool(matched_identifiers(request.question, lexical_hits))
+    hit = answer_cache.get_exact(request.session_id, request.question, version, count_miss=shortcut)
+    query_vector = None
+    if hit is None and not shortcut:
+        query_vector = await embed_question(get_embedding_model(), request.question)
+        hit = answer_cache.get_similar(request.session_id, request.question, query_vector, version)
+    if hit is None:
+        return None, query_vector, version, lexical_hits
+
+    cached, similarity, age = hit
+    return QueryResponse(**{
+        **cached,
+        "processing_time": time.time() - start_time,
+        "metadata": {**cached["metadata"], "cache_hit": True, "cache_similarity": round(similarity, 4), "cache_age": round(age, 1)},
+    }), None, None, None
+
+@app.post("/api/v1/query", response_model=QueryResponse)
+async def query_notebook(request: QueryRequest):
+    """Query a notebook with RAG + web fallback; stream=true returns Server-Sent Events"""
+    start_time = time.time()
+    trace = start_trace("query")
+    if request.session_id:
+        record_notebook_use(request.session_id)
+
+    cached, query_vector, version, lexical_hits = await lookup_answer_cache(request, start_time)
+    if cached is not None:
+        metrics.observe("progression_query_seconds", cached.processing_time, source="cache")
+        cached.metadata.update(trace.metadata())
+        return stream_cached_answer(cached) if request.stream else cached
+
+    plan = await plan_answer(request, query_vector, lexical_hits)
+    plan["metadata"]["cache_hit"] = False
+    plan["trace"] = trace
+
+    def remember(answer: str, processing_time: float):
+        if version is not None:
+            response = answer_response(plan, answer, processing_time)
+            answer_cache.put(request.session_id, request.question, query_vector, version, response.dict())
+
+    if request.stream:
+        return stream_answer(plan, start_time, on_complete=remember)
+
+    chain = plan["prompt"] | get_llm() | StrOutputParser()
+    with stage("answer_generation"):
+        answer = await chain.ainvoke(plan["inputs"])
+
+    processing_time = time.time() - start_time
+    metrics.observe("progression_query_seconds", processing_time, source=plan["source"])
+    plan["metadata"].update(trace.metadata())
+    remember(answer, processing_time)
+    return answer_response(plan, answer, processing_time)
+
+def batch_error_line(index: int, question: str, error: Exception) -> str:
+    detail = error.detail if isinstance(error, HTTPException) else str(error)
+    return json.dumps({"type": "error", "index": index, "question": question, "success": False, "error": detail}) + "\n"
 
-        return QueryResponse(
-            answer=answer,
-            source="pdf",
-            pdf_sources=pdf_sources,
-            web_sources=None,
-            chunks_used=len(chunks),
-            processing_time=processing_time,
-            metadata={"model": "gpt-4o-mini", "can_answer": True}
+def stream_batch(
+    session_id: str,
+    vectorstore: VectorStore,
+    questions: List[str],
+    concurrency: int,
+    start_time: float,
+    trace: RequestTrace
+) -> StreamingResponse:
+    """
+    Answer many questions against one loaded notebook, streamed as NDJSON in completion order: one
+    'result' or 'error' line per question (carrying its index) as soon as that question is done, then
+    a 'done' line with counts, timings and the batch's stages and tokens.
+    Questions that need vectors are embedded in a single embedding call; every question then runs
+    as its own task, with at most concurrency relevance checks, web searches and answers in flight.
+    A question that fails gets an 'error' line and the others carry on.
+    """
+    stats = {"questions": len(questions), "embedded_questions": 0, "embedding_calls": 0, "relevance_checks": 0, "web_searches": 0}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def embed_questions(positions: List[int]) -> Dict[int, List[float]]:
+        with stage("query_embedding"):
+            embedded = await vectorstore.embeddings.aembed_documents([questions[i] for i in positions])
+        metrics.inc(
+            "progression_embedding_tokens_total", sum(count_tokens(questions[i]) for i in positions), purpose="query"
         )
-    else:
-        # Fallback to web search
-        web_sources = perform_web_search(request.question)
+        return dict(zip(positions, embedded))
 
-        if not web_sources:
-            raise HTTPException(
-                status_code=404,
-                detail="No information found in PDF and web search failed"
-            )
+    async def answer_question(
+        index: int,
+        lexical_hits: List[tuple[Document, float]],
+        query_vectors: Optional[asyncio.Future]
+    ) -> QueryResponse:
+        question = questions[index]
+        # Shielded: a question cancelled while waiting must not cancel the embedding the others share
+        query_vector = (await asyncio.shield(query_vectors))[index] if query_vectors is not None else None
+        chunks, scores, retrieval_info = await retrieve_chunks(session_id, vectorstore, question, lexical_hits, query_vector)
+        with stage("context_build"):
+            context, context_info = await run_blocking(build_context, chunks)
+
+        can_answer, gate_info = score_gate(context, scores)
+        gate_info["retrieval"] = retrieval_info
+        if can_answer is None:
+            stats["relevance_checks"] += 1
+            async with limit:
+                can_answer = await check_answer_in_context(question, context)
+        record_context_savings(gate_info, context_info, can_answer)
 
-        web_context = "\n\n".join([
-            f"Title: {src.title}\nURL: {src.url}\nContent: {src.snippet}"
-            for src in web_sources
-        ])
+        if can_answer:
+            plan = pdf_answer_plan(question, chunks, context, gate_info)
+        else:
+            stats["web_searches"] += 1
+            async with limit:
+                web_sources = await perform_web_search(question)
+            plan = web_answer_plan(question, web_sources, gate_info)
 
-        chain = web_answer_prompt | llm | StrOutputParser()
-        answer = chain.invoke({"question": request.question, "web_context": web_context})
+        chain = plan["prompt"] | get_llm() | StrOutputParser()
+        async with limit:
+            with stage("answer_generation"):
+                answer = await chain.ainvoke(plan["inputs"])
+        return answer_response(plan, answer, time.time() - start_time)
 
-        processing_time = time.time() - start_time
+    async def run_question(
+        index: int,
+        lexical_hits: Union[List[tuple[Document, float]], BaseException],
+        query_vectors: Optional[asyncio.Future]
+    ) -> tuple[int, Union[QueryResponse, Exception]]:
+        try:
+            if isinstance(lexical_hits, BaseException):
+                raise lexical_hits
+            return index, await answer_question(index, lexical_hits, query_vectors)
+        except Exception as e:
+            return index, e
 
-        return QueryResponse(
-            answer=answer,
-            source="web",
-            pdf_sources=None,
-            web_sources=web_sources,
-            chunks_used=None,
-            processing_time=processing_time,
-            metadata={"model": "gpt-4o-mini", "can_answer": False}
+    async def lines():
+        current_trace.set(trace)
+        lexical = await asyncio.gather(
+            *(lexical_candidates(session_id, question) for question in questions), return_exceptions=True
         )
+        to_embed = [
+            i for i, question in enumerate(questions)
+            if not isinstance(lexical[i], BaseException)
+            and not (LEXICAL_SHORTCUT and matched_identifiers(question, lexical[i]))
+        ]
+        query_vectors = asyncio.ensure_future(embed_questions(to_embed)) if to_embed else None
+        stats["embedded_questions"] = len(to_embed)
+        stats["embedding_calls"] = 1 if to_embed else 0
+        embedded = set(to_embed)
+        tasks = [
+            asyncio.create_task(run_question(i, lexical[i], query_vectors if i in embedded else None))
+            for i in range(len(questions))
+        ]
+
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, response = await next_done
+                if isinstance(response, Exception):
+                    failed += 1
+                    yield batch_error_line(index, questions[index], response)
+                else:
+                    yield json.dumps({"type": "result", "index": index, "question": questions[index], **response.dict()}) + "\n"
+        finally:
+            # The client went away: stop the questions still running
+            for task in tasks:
+                task.cancel()
+            if query_vectors is not None:
+                query_vectors.cancel()
+
+        yield json.dumps({
+            "type": "done",
+            "answered": len(questions) - failed,
+            "failed": failed,
+            "processing_time": time.time() - start_time,
+            **stats,
+            **trace.metadata(),
+        }) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/v1/query/batch")
+async def query_notebook_batch(request: BatchQueryRequest):
+    """Answer many questions about one notebook, streamed back as NDJSON as each answer completes"""
+    start_time = time.time()
+    trace = start_trace("batch")
+    record_notebook_use(request.session_id)
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    concurrency = max(1, min(request.max_concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    # Loaded before streaming, so an unknown or unready notebook is still a normal HTTP error
+    vectorstore = await load_query_vectorstore(request.session_id)
+    return stream_batch(request.session_id, vectorstore, request.questions, concurrency, start_time, trace)
 
 @app.get("/api/v1/notebooks")
-async def list_notebooks():
-    """List all notebooks"""
-    notebooks = get_all_notebooks()
-    return {"success": True, "notebooks": [nb.dict() for nb in notebooks]}
+async def list_notebooks(
+    limit: int = Query(NOTEBOOKS_PAGE_SIZE, ge=1, le=NOTEBOOKS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """List notebooks newest first, one page at a time; pass next_cursor back to get the next page"""
+    after = decode_notebooks_cursor(cursor) if cursor else None
+    notebooks, next_cursor = await run_blocking(list_notebooks_page, limit, after)
+    return {"success": True, "notebooks": [nb.dict() for nb in notebooks], "next_cursor": next_cursor}
 
 @app.delete("/api/v1/notebooks/{notebook_id}")
 async def delete_notebook(notebook_id: str):
     """Delete a notebook and all associated data"""
-    import shutil
-
     # Delete from database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM notebooks WHERE id = ?", (notebook_id,))
-    deleted_count = cursor.rowcount
-    conn.commit()
-    conn.close()
-
-    if deleted_count == 0:
+    deleted = await run_blocking(delete_notebook_record, notebook_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
-    # Delete PDF files
-    pdf_dir = PDFS_DIR / notebook_id
-    if pdf_dir.exists():
-        shutil.rmtree(pdf_dir)
+    vectorstore_cache.invalidate(notebook_id)
+    answer_cache.invalidate(notebook_id)
+    notebook_locks.pop(notebook_id, None)
 
-    # Delete FAISS index
-    index_dir = INDEX_DIR / notebook_id
-    if index_dir.exists():
-        shutil.rmtree(index_dir)
+    # Delete PDF files and FAISS index
+    await run_blocking(delete_notebook_files, notebook_id)
 
     return {"success": True, "message": "Notebook deleted successfully"}
 
+class PdfFileResponse(FileResponse):
+    # Larger reads than Starlette's 64 KB default when the server cannot use sendfile
+    chunk_size = 256 * 1024
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+def not_modified(request: Request, response: FileResponse) -> bool:
+    """Whether a conditional GET can be answered with 304 from the response's validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, response.headers["etag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            # "-0000" and zone-less dates parse naive; HTTP dates are always UTC
+            since = since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(response.headers["last-modified"]) <= since
+    return False
+
 @app.get("/api/v1/notebooks/{notebook_id}/pdf/{file_name}")
-async def get_pdf(notebook_id: str, file_name: str):
-    """Serve PDF file"""
+async def get_pdf(notebook_id: str, file_name: str, request: Request):
+    """
+    Serve a notebook PDF with byte ranges (206), ETag/Last-Modified validators and 304 responses.
+    Servers that support the ASGI pathsend extension send the file with zero-copy sendfile.
+    """
     # Path sanitization
     file_name = os.path.basename(file_name)
     pdf_path = PDFS_DIR / notebook_id / file_name
 
-    if not pdf_path.exists():
+    try:
+        stat_result = await run_blocking(os.stat, pdf_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    def iter_file():
-        with open(pdf_path, "rb") as f:
-            yield from f
-
-    return StreamingResponse(
-        iter_file(),
+    response = PdfFileResponse(
+        pdf_path,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={file_name}"}
+        filename=file_name,
+        content_disposition_type="inline",
+        stat_result=stat_result,
+        headers={"Cache-Control": "no-cache"}
     )
+    if not_modified(request, response):
+        return Response(
+            status_code=304,
+            headers={name: response.headers[name] for name in ("etag", "last-modified", "cache-control")}
+        )
+    return response
 
 def find_available_port(start_port=8000, max_attempts=10):
     """Find an available port starting from start_port"""
@@ -530,7 +4253,14 @@ def find_available_port(start_port=8000, max_attempts=10):
     raise RuntimeError(f"Could not find available port in range {start_port}-{start_port + max_attempts}")
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["migrate-index"]:
+        sys.exit(migrate_indexes_cli(sys.argv[2:]))
+
     import uvicorn
     port = find_available_port(PORT)
-    print(f"🚀 Starting Progression LM on http://localhost:{port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    print(f"🚀 Starting Progression LM on http://localhost:{port}" + (f" ({WORKERS} workers)" if WORKERS > 1 else ""))
+    if WORKERS > 1:
+        # Each worker process imports the app itself, so uvicorn needs it as an import string
+        uvicorn.run("app:app", host="0.0.0.0", port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
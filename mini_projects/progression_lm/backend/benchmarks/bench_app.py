@@ -0,0 +1,314 @@
+"""
+End-to-end benchmark of the upload and query endpoints with local stand-ins for OpenAI and Tavily.
+The app runs in-process behind an ASGI transport with its lifespan (ingestion workers, parse pool);
+embedding_model, llm and tavily_search are replaced by deterministic fakes with configurable latency,
+so runs need no API keys or network and are comparable over time.
+
+Reports:
+- ingestion: pages/s and chunks/s per synthetic PDF, from upload to a ready job, with job stages
+- queries: p50/p95/p99 latency and throughput at each concurrency level, answer cache bypassed
+- peak RSS of the app process and of the parse worker processes
+
+Fake embeddings are hashed bag-of-words vectors, so questions built from a page's words retrieve it
+and off-topic questions fall back to the (fake) web search, exercising both answer paths.
+Environment variables (INDEX_FORMAT, RETRIEVAL_MODE, PARSE_WORKERS, ...) apply as for the server.
+
+Usage (from the backend directory):
+    python benchmarks/bench_app.py --pages 10 50 200 --queries 200 --concurrency 1 8 32
+    python benchmarks/bench_app.py --embed-latency-ms 150 --llm-latency-ms 400 --output app.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+COMPONENTS = "pump valve sensor bracket actuator relay compressor gasket manifold controller bearing filter".split()
+SYMPTOMS = "overheating vibration leakage stalling corrosion flicker noise drift surge clogging".split()
+ACTIONS = "replace recalibrate tighten flush reseat lubricate inspect reset isolate realign".split()
+OFF_TOPIC = [
+    "Who won the football world cup in 1998?",
+    "What is the population of Lisbon?",
+    "How tall is Mount Kilimanjaro?",
+    "When was the printing press invented?",
+]
+FAKE_ANSWER = "According to the provided context, the procedure is described in the referenced section of the manual."
+
+
+def make_fakes(dims: int, embed_latency: float, llm_latency: float, token_latency: float, web_latency: float):
+    """Fake embeddings, chat model and Tavily search with the given latencies (seconds)"""
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class FakeEmbeddings(Embeddings):
+        """Hashed bag-of-words unit vectors; each call waits embed_latency like one API request"""
+
+        def vector(self, text):
+            vector = np.zeros(dims, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dims] += 1.0
+            return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+        def embed_documents(self, texts):
+            time.sleep(embed_latency)
+            return [self.vector(text) for text in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+        async def aembed_documents(self, texts):
+            await asyncio.sleep(embed_latency)
+            return [self.vector(text) for text in texts]
+
+        async def aembed_query(self, text):
+            return (await self.aembed_documents([text]))[0]
+
+    class FakeChatModel(BaseChatModel):
+        """Answers YES to relevance checks and a fixed answer otherwise, reporting token usage"""
+
+        @property
+        def _llm_type(self):
+            return "fake-chat"
+
+        def reply(self, messages):
+            prompt = messages[-1].content
+            text = "YES" if "Respond with ONLY" in prompt else FAKE_ANSWER
+            usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(text.split())}
+            usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+            return text, usage
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(llm_latency)
+            text, usage = self.reply(messages)
+            message = AIMessage(content=text, usage_metadata=usage, response_metadata={"model_name": "fake-chat"})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(llm_latency)
+            text, usage = self.reply(messages)
+            message = AIMessage(content=text, usage_metadata=usage, response_metadata={"model_name": "fake-chat"})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(llm_latency)
+            text, usage = self.reply(messages)
+            for word in text.split(" "):
+                await asyncio.sleep(token_latency)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", usage_metadata=usage, response_metadata={"model_name": "fake-chat"}
+            ))
+
+    class FakeTavily:
+        async def ainvoke(self, query):
+            await asyncio.sleep(web_latency)
+            return {"results": [
+                {"title": f"Result {i}", "url": f"https://example.com/{i}", "content": f"Web result {i} for: {query['query']}"}
+                for i in range(3)
+            ]}
+
+    return FakeEmbeddings(), FakeChatModel, FakeTavily()
+
+
+def synthetic_pdf(path: Path, pages: int, seed: int):
+    """A manual of the given length; every page documents a few parts, with text unique to this PDF"""
+    import pymupdf
+
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    facts = []
+    for page_number in range(pages):
+        paragraphs = []
+        for item in range(6):
+            component, symptom, action = rng.choice(COMPONENTS), rng.choice(SYMPTOMS), rng.choice(ACTIONS)
+            error = f"E{seed}{page_number:04d}{item}"
+            facts.append((component, symptom, action, error))
+            paragraphs.append(
+                f"Error {error} indicates {symptom} in the {component} of unit {rng.randint(1, 99)}. "
+                f"Technicians should {action} the {component} before restarting, check the {rng.choice(COMPONENTS)} "
+                f"for {rng.choice(SYMPTOMS)}, and log the event in the maintenance record of manual {seed}."
+            )
+        page = doc.new_page()
+        page.insert_textbox(pymupdf.Rect(50, 50, 545, 790), "\n\n".join(paragraphs), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return facts
+
+
+def synthetic_questions(facts, count: int, web_fraction: float):
+    rng = random.Random(7)
+    questions = []
+    for _ in range(count):
+        if rng.random() < web_fraction:
+            questions.append(rng.choice(OFF_TOPIC))
+            continue
+        component, symptom, action, error = rng.choice(facts)
+        questions.append(rng.choice([
+            f"What does error {error} mean?",
+            f"How do I {action} the {component} when it shows {symptom}?",
+        ]))
+    return questions
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest finished child, in MB"""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    return {
+        "app": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1),
+        "parse_workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor, 1),
+    }
+
+
+async def ingest(client, pdf_path: Path, pages: int):
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        response = await client.post(
+            "/api/v1/upload", data={"name": pdf_path.stem}, files={"pdf": (pdf_path.name, f, "application/pdf")}
+        )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/v1/jobs/{job_id}")).json()["job"]
+        if job["status"] in ("ready", "failed"):
+            break
+        await asyncio.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    if job["status"] == "failed":
+        raise RuntimeError(f"Ingestion of {pdf_path.name} failed: {job['error']}")
+    return job["session_id"], {
+        "pages": pages,
+        "chunks": job["chunks_total"],
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1),
+        "chunks_per_second": round(job["chunks_total"] / elapsed, 1),
+        "stages": job["stages"],
+    }
+
+
+async def run_queries(client, session_id: str, questions, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, sources, errors = [], {}, 0
+
+    async def one(question: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/v1/query", json={"session_id": session_id, "question": question, "cache": False}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+            return
+        source = response.json()["source"]
+        sources[source] = sources.get(source, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(question) for question in questions))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(questions),
+        "errors": errors,
+        "sources": sources,
+        "queries_per_second": round(len(questions) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+async def run(app, args, work_dir: Path):
+    import httpx
+
+    results = {"ingestion": [], "queries": []}
+    facts_by_session = {}
+    async with app.app.router.lifespan_context(app.app):
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for seed, pages in enumerate(args.pages, start=1):
+                pdf_path = work_dir / f"manual_{pages}p.pdf"
+                facts = synthetic_pdf(pdf_path, pages, seed)
+                session_id, result = await ingest(client, pdf_path, pages)
+                facts_by_session[session_id] = facts
+                results["ingestion"].append(result)
+                print(f"ingest {pages:>5} pages  {result['chunks']:>6} chunks  {result['seconds']:>7}s  "
+                      f"{result['pages_per_second']:>7} pages/s  {result['chunks_per_second']:>8} chunks/s")
+            results["peak_rss_after_ingestion_mb"] = peak_rss_mb()
+
+            # Query the largest notebook
+            session_id = list(facts_by_session)[-1]
+            questions = synthetic_questions(facts_by_session[session_id], args.queries, args.web_fraction)
+            await run_queries(client, session_id, questions[:min(10, len(questions))], 1)  # warm the index cache
+            for concurrency in args.concurrency:
+                result = await run_queries(client, session_id, questions, concurrency)
+                results["queries"].append(result)
+                print(f"query  c={concurrency:<4} {result['queries_per_second']:>7} q/s  p50={result['p50_ms']:>8} ms  "
+                      f"p95={result['p95_ms']:>8} ms  p99={result['p99_ms']:>8} ms  errors={result['errors']}  "
+                      f"sources={result['sources']}")
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200], help="page counts of the synthetic PDFs")
+    parser.add_argument("--queries", type=int, default=200, help="queries per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--web-fraction", type=float, default=0.2, help="share of off-topic questions answered from the web")
+    parser.add_argument("--dims", type=int, default=256, help="dimensions of the fake embeddings")
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="time to the first token of each LLM call")
+    parser.add_argument("--token-latency-ms", type=float, default=5, help="time between streamed tokens")
+    parser.add_argument("--web-latency-ms", type=float, default=500)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    # app.py keeps its data directory relative to the working directory
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_app_"))
+    os.chdir(work_dir)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+
+    embeddings, chat_model_class, tavily = make_fakes(
+        args.dims, args.embed_latency_ms / 1000, args.llm_latency_ms / 1000,
+        args.token_latency_ms / 1000, args.web_latency_ms / 1000
+    )
+    app.embedding_model = embeddings
+    app.llm = chat_model_class(callbacks=[app.LlmUsageRecorder()])
+    app.tavily_search = tavily
+
+    results = asyncio.run(run(app, args, work_dir))
+    rss = results["peak_rss_mb"]
+    print(f"peak RSS: app {rss['app']} MB, parse workers {rss['parse_workers']} MB")
+    if output:
+        output.write_text(json.dumps({
+            "args": vars(args),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            **results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Metadata database benchmark: notebook listing with many notebooks and concurrent writers.
+Seeds a fresh data/db.sqlite with synthetic notebooks, then measures:
+- listing: the old full listing (every row) against keyset pages (first page and a deep page)
+- writers: threads creating notebooks, updating status and recording sources through the pooled
+  access layer, against opening a new connection per call as the data layer used to
+
+Usage (from the backend directory):
+    python benchmarks/bench_db.py --notebooks 100000 --threads 8 --ops 500
+    python benchmarks/bench_db.py --notebooks 20000 --output db.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def seed(app, count: int):
+    start = datetime(2024, 1, 1)
+    rows = (
+        (str(uuid.uuid4()), f"Notebook {i}", (start + timedelta(seconds=i)).isoformat(), 1, "ready")
+        for i in range(count)
+    )
+    with app.db_pool.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO notebooks (id, name, created_at, sources_count, status) VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+
+def timed_ms(func, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(float(np.percentile(samples, 50)), 3)
+
+
+def bench_listing(app, page_size: int, repeat: int):
+    def list_all():
+        conn = sqlite3.connect(app.DB_PATH)
+        conn.execute("SELECT id, name, created_at, sources_count, status FROM notebooks ORDER BY created_at DESC").fetchall()
+        conn.close()
+
+    # Cursor of a page halfway through the table
+    with app.db_pool.connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM notebooks").fetchone()[0]
+        created_at, notebook_id = conn.execute(
+            "SELECT created_at, id FROM notebooks ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?", (total // 2,)
+        ).fetchone()
+
+    return {
+        "full_listing_ms": timed_ms(list_all, max(1, repeat // 10)),
+        "first_page_ms": timed_ms(lambda: app.list_notebooks_page(page_size), repeat),
+        "deep_page_ms": timed_ms(lambda: app.list_notebooks_page(page_size, (created_at, notebook_id)), repeat),
+    }
+
+
+def writer_ops(app, pooled: bool):
+    """One notebook's lifecycle: create, mark indexing, record a source, read status"""
+    notebook_id = str(uuid.uuid4())
+    if pooled:
+        app.insert_notebook(notebook_id, "bench", status="indexing")
+        app.set_notebook_status(notebook_id, "indexing")
+        app.finish_source_ingestion(notebook_id, "bench.pdf", notebook_id, 10)
+        app.get_notebook_status(notebook_id)
+        return
+    conn = sqlite3.connect(app.DB_PATH)
+    conn.execute(
+        "INSERT INTO notebooks (id, name, created_at, sources_count, status) VALUES (?, ?, ?, ?, ?)",
+        (notebook_id, "bench", datetime.utcnow().isoformat(), 0, "indexing")
+    )
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(app.DB_PATH)
+    conn.execute("UPDATE notebooks SET status = ? WHERE id = ?", ("indexing", notebook_id))
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(app.DB_PATH)
+    conn.execute("UPDATE notebooks SET status = 'ready' WHERE id = ?", (notebook_id,))
+    conn.execute(
+        "INSERT OR REPLACE INTO sources (notebook_id, file_name, content_sha256, num_chunks, added_at) VALUES (?, ?, ?, ?, ?)",
+        (notebook_id, "bench.pdf", notebook_id, 10, datetime.utcnow().isoformat())
+    )
+    conn.execute(
+        "UPDATE notebooks SET sources_count = (SELECT COUNT(*) FROM sources WHERE notebook_id = ?) WHERE id = ?",
+        (notebook_id, notebook_id)
+    )
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(app.DB_PATH)
+    conn.execute("SELECT status FROM notebooks WHERE id = ?", (notebook_id,)).fetchone()
+    conn.close()
+
+
+def bench_writers(app, threads: int, ops: int, pooled: bool):
+    errors = []
+
+    def worker():
+        for _ in range(ops):
+            try:
+                writer_ops(app, pooled)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "notebooks_per_second": round(threads * ops / elapsed, 1),
+        "seconds": round(elapsed, 2),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notebooks", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="notebook lifecycles per writer thread")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_db_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+    app.init_storage()
+
+    start = time.perf_counter()
+    seed(app, args.notebooks)
+    print(f"{args.notebooks} notebooks seeded in {time.perf_counter() - start:.1f}s")
+
+    listing = bench_listing(app, args.page_size, args.repeat)
+    print(f"listing: all rows {listing['full_listing_ms']} ms, first page {listing['first_page_ms']} ms, "
+          f"deep page {listing['deep_page_ms']} ms ({args.page_size} per page)")
+
+    writers = {}
+    for name, pooled in (("connect_per_call", False), ("pooled", True)):
+        writers[name] = bench_writers(app, args.threads, args.ops, pooled)
+        r = writers[name]
+        print(f"writers {name:<17} {r['notebooks_per_second']:>8} notebooks/s  {r['seconds']:>6}s  errors={r['errors']}")
+
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "listing": listing, "writers": writers}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Embedding scheduler benchmark against the local fake embeddings server.
+Measures ingestion embedding throughput (chunks/s) for several concurrency levels,
+including the retry/backoff path when the fake server enforces an RPM limit.
+
+Usage (from the backend directory):
+    python benchmarks/bench_embedding.py --chunks 2000 --latency-ms 150 --concurrency 1 2 4 8
+    python benchmarks/bench_embedding.py --server-rpm 120 --rpm 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_embedding_server import create_app  # noqa: E402
+
+WORDS = "pump valve sensor clause warranty torque module firmware error code bracket assembly voltage".split()
+
+
+def synthetic_chunks(count: int, chars: int = 1000):
+    rng = random.Random(42)
+    chunks = []
+    for i in range(count):
+        words = [f"chunk{i}"]
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(WORDS))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def start_server(port: int, latency_ms: float, dims: int, rpm: int):
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(latency_ms, dims, rpm), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_scenarios(app, texts, args):
+    results = []
+    for concurrency in args.concurrency:
+        scheduler = app.EmbeddingScheduler(
+            args.batch_tokens, app.EMBED_BATCH_MAX_INPUTS, concurrency, args.rpm, args.tpm, app.EMBED_MAX_RETRIES
+        )
+        start = time.perf_counter()
+        vectors = await scheduler.embed(texts)
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == len(texts)
+        stats = scheduler.stats()
+        results.append({
+            "concurrency": concurrency,
+            "chunks": len(texts),
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(len(texts) / elapsed, 1),
+            "requests": stats["requests"],
+            "retries": stats["retries"],
+        })
+        print(
+            f"concurrency={concurrency:<3} {results[-1]['chunks_per_second']:>8} chunks/s  "
+            f"{elapsed:6.2f}s  requests={stats['requests']} retries={stats['retries']}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--server-rpm", type=int, default=0, help="RPM the fake server enforces with 429s")
+    parser.add_argument("--rpm", type=int, default=3000, help="RPM limit given to the scheduler")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="TPM limit given to the scheduler")
+    parser.add_argument("--batch-tokens", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_embedding_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+    from langchain_openai import OpenAIEmbeddings
+
+    server = start_server(args.port, args.latency_ms, args.dims, args.server_rpm)
+    app.embedding_model = OpenAIEmbeddings(
+        model=app.EMBEDDING_MODEL,
+        base_url=f"http://127.0.0.1:{args.port}/v1",
+        api_key="fake",
+        # Texts are sent as-is; the fake server needs no tiktoken pre-tokenization
+        check_embedding_ctx_length=False,
+        max_retries=0,
+    )
+
+    texts = synthetic_chunks(args.chunks)
+    # One event loop for all runs: the async OpenAI client is bound to the loop that first used it
+    results = asyncio.run(run_scenarios(app, texts, args))
+
+    server.should_exit = True
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
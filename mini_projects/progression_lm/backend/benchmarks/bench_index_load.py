@@ -0,0 +1,88 @@
+"""
+Cold-load benchmark for the two notebook index formats.
+Builds a synthetic notebook index in both the FAISS (pickled docstore) and memory-mapped formats,
+then times opening each one and running a first query.
+
+Usage (from the backend directory):
+    python benchmarks/bench_index_load.py --chunks 50000 --dims 3072
+    python benchmarks/bench_index_load.py --chunks 50000 --dtype float16 --output load.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def synthetic_index(count: int, dims: int):
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((count, dims), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 35 for i in range(count)]
+    metadatas = [{"file_name": "synthetic.pdf", "page_number": i // 4 + 1, "page_start": i // 4 + 1,
+                  "page_end": i // 4 + 1, "session_id": "bench"} for i in range(count)]
+    return vectors, texts, metadatas
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=3072)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_index_load_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+    app.init_storage()
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    vectors, texts, metadatas = synthetic_index(args.chunks, args.dims)
+    query = vectors[0]
+
+    faiss_id, mmap_id = f"faiss-{uuid.uuid4().hex}", f"mmap-{uuid.uuid4().hex}"
+    store = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), app.get_embedding_model(), metadatas=metadatas)
+    app.save_vectorstore(store, faiss_id)
+    documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+    app.save_mmap_index(mmap_id, documents, [vectors], args.dims, args.dtype)
+    del store, documents
+
+    results = {}
+    for name, session_id in (("faiss", faiss_id), ("mmap", mmap_id)):
+        loaded, load_seconds = timed(lambda: app.load_vectorstore(session_id))
+        _, query_seconds = timed(lambda: loaded.similarity_search_with_score_by_vector(query.tolist(), k=5))
+        size = sum(path.stat().st_size for path in (app.INDEX_DIR / session_id).iterdir())
+        results[name] = {
+            "load_ms": round(load_seconds * 1000, 2),
+            "first_query_ms": round(query_seconds * 1000, 2),
+            "disk_mb": round(size / 1024 / 1024, 1),
+        }
+        print(f"{name:<6} load={results[name]['load_ms']:>9} ms  first query={results[name]['first_query_ms']:>8} ms  "
+              f"disk={results[name]['disk_mb']} MB")
+
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
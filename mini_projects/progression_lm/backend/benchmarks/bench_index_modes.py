@@ -0,0 +1,120 @@
+"""
+Recall-vs-memory benchmark for the FAISS index modes (INDEX_MODE) and embedding truncation
+(EMBEDDING_DIMENSIONS). Ground truth is exact search over the full-dimension vectors, so recall
+includes the loss from both truncation and quantization.
+
+Vectors are synthetic clustered unit vectors by default; pass --from-cache to use the real
+embeddings stored in a data/embeddings.sqlite file. Synthetic vectors spread information evenly
+across dimensions, unlike text-embedding-3, so they understate recall after truncation.
+
+Usage (from the backend directory):
+    python benchmarks/bench_index_modes.py --chunks 20000 --dims 3072 --modes flat fp16 sq8 ivfpq
+    python benchmarks/bench_index_modes.py --from-cache data/embeddings.sqlite --truncate 3072 1024 256
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def synthetic_vectors(count: int, dims: int, clusters: int = 200) -> np.ndarray:
+    """Unit vectors around random topic centres, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(42)
+    centres = rng.standard_normal((clusters, dims), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dims), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cached_vectors(path: Path, limit: int) -> np.ndarray:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT vector FROM embeddings LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return np.stack([np.frombuffer(blob, dtype=np.float32) for (blob,) in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=3072, help="dimensions of synthetic vectors")
+    parser.add_argument("--from-cache", help="read vectors from an embeddings.sqlite cache instead")
+    parser.add_argument("--modes", nargs="+", default=["flat", "fp16", "sq8", "ivfpq"])
+    parser.add_argument("--truncate", type=int, nargs="+", default=[0], help="EMBEDDING_DIMENSIONS values (0 = full)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    cache_path = Path(args.from_cache).resolve() if args.from_cache else None
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_index_modes_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+    import faiss
+
+    app.IVF_MIN_CHUNKS = 0
+    app.IVF_NPROBE = args.nprobe
+    app.PQ_M = args.pq_m
+
+    vectors = cached_vectors(cache_path, args.chunks) if cache_path else synthetic_vectors(args.chunks, args.dims)
+    rng = np.random.default_rng(7)
+    # Queries are perturbed copies of stored chunks, like questions close to a passage
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape, dtype=np.float32) / np.sqrt(queries.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k}")
+    for dims in args.truncate:
+        dims = dims or None
+        stored = app.truncate_embeddings(vectors, dims)
+        searched = app.truncate_embeddings(queries, dims)
+        for mode in args.modes:
+            start = time.perf_counter()
+            index = app.build_faiss_index(stored, mode)
+            index.add(stored)
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            _, found = index.search(searched, args.k)
+            query_ms = (time.perf_counter() - start) * 1000 / len(searched)
+
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            memory = faiss.serialize_index(index).nbytes
+            results.append({
+                "mode": mode,
+                "dims": stored.shape[1],
+                "spec": app.faiss_index_spec(len(stored), stored.shape[1], mode),
+                "recall": round(float(recall), 4),
+                "index_mb": round(memory / 1024 / 1024, 2),
+                "bytes_per_chunk": round(memory / len(stored), 1),
+                "query_ms": round(query_ms, 3),
+                "build_seconds": round(build_seconds, 2),
+            })
+            r = results[-1]
+            print(f"{mode:<6} dims={r['dims']:<5} {r['spec']:<14} recall={r['recall']:<7} "
+                  f"{r['index_mb']:>8} MB  {r['bytes_per_chunk']:>8} B/chunk  {r['query_ms']:>7} ms/query")
+
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
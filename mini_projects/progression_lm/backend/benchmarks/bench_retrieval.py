@@ -0,0 +1,171 @@
+"""
+Retrieval quality and latency benchmark for dense, hybrid (BM25 + vectors, RRF) and hybrid with the
+lexical shortcut (RETRIEVAL_MODE / LEXICAL_SHORTCUT).
+Builds a synthetic equipment-manual notebook where every chunk documents one part number, error code
+and contract clause, then asks identifier questions ("What does error E4213 mean?") and descriptive
+questions whose words come from the chunk but not its identifiers.
+
+Embeddings are hashed bag-of-words vectors by default, which know nothing of identifier structure,
+much like real embedding models; pass --openai to embed with EMBEDDING_MODEL instead.
+
+Usage (from the backend directory):
+    python benchmarks/bench_retrieval.py --chunks 5000 --queries 300
+    python benchmarks/bench_retrieval.py --chunks 2000 --openai --output retrieval.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+COMPONENTS = "pump valve sensor bracket actuator relay compressor gasket manifold controller bearing filter".split()
+SYMPTOMS = "overheating vibration leakage stalling corrosion flicker noise drift surge clogging".split()
+ACTIONS = "replace recalibrate tighten flush reseat lubricate inspect reset isolate realign".split()
+
+
+def synthetic_manual(count: int):
+    """Chunks of a synthetic manual; each names one component, symptom, action and three identifiers"""
+    rng = random.Random(42)
+    chunks = []
+    for i in range(count):
+        component, symptom, action = rng.choice(COMPONENTS), rng.choice(SYMPTOMS), rng.choice(ACTIONS)
+        part, error, clause = f"{component[:2].upper()}-{10000 + i}", f"E{4000 + i}", f"{i // 100 + 1}.{i % 100 // 10 + 1}.{i % 10 + 1}"
+        text = (
+            f"Part {part} is the {component} assembly of unit {i % 50}. Error {error} indicates {symptom} "
+            f"in the {component}; {action} it before restarting. Under clause {clause} the warranty covers "
+            f"{symptom} damage to the {component} for {rng.randint(6, 36)} months."
+        )
+        chunks.append((text, {"part": part, "error": error, "clause": clause,
+                              "component": component, "symptom": symptom, "action": action}))
+    return chunks
+
+
+def synthetic_queries(chunks, count: int):
+    rng = random.Random(7)
+    queries = []
+    for target in rng.sample(range(len(chunks)), count):
+        facts = chunks[target][1]
+        kind = rng.choice(["part", "error", "clause", "descriptive"])
+        question = {
+            "part": f"What is part {facts['part']}?",
+            "error": f"What does error {facts['error']} mean?",
+            "clause": f"What does clause {facts['clause']} cover?",
+            "descriptive": f"How do I fix {facts['symptom']} in the {facts['component']} so I can "
+                           f"{facts['action']} it?",
+        }[kind]
+        queries.append((kind, question, target))
+    return queries
+
+
+def hashed_embeddings(dims: int):
+    from langchain_core.embeddings import Embeddings
+
+    class HashedBagOfWords(Embeddings):
+        """Deterministic bag-of-words vectors; identifiers hash like any other token"""
+
+        def embed_query(self, text):
+            vector = np.zeros(dims, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dims] += 1.0
+            return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+    return HashedBagOfWords()
+
+
+async def run_scenarios(app, vectorstore, session_id, queries, k):
+    scenarios = [("dense", "dense", False), ("hybrid", "hybrid", False), ("hybrid+shortcut", "hybrid", True)]
+    results = []
+    for name, mode, shortcut in scenarios:
+        app.RETRIEVAL_MODE, app.LEXICAL_SHORTCUT = mode, shortcut
+        per_kind = {}
+        latencies, skipped = [], 0
+        for kind, question, target in queries:
+            start = time.perf_counter()
+            chunks, _, info = await app.retrieve_chunks(session_id, vectorstore, question)
+            latencies.append((time.perf_counter() - start) * 1000)
+            skipped += info["embedding_skipped"]
+            ranks = [i for i, chunk in enumerate(chunks[:k], start=1) if chunk.metadata["target"] == target]
+            stats = per_kind.setdefault(kind, {"hits": 0, "rr": 0.0, "count": 0})
+            stats["count"] += 1
+            stats["hits"] += bool(ranks)
+            stats["rr"] += 1 / ranks[0] if ranks else 0.0
+        total = len(queries)
+        results.append({
+            "scenario": name,
+            f"recall@{k}": round(sum(s["hits"] for s in per_kind.values()) / total, 4),
+            "mrr": round(sum(s["rr"] for s in per_kind.values()) / total, 4),
+            "by_kind": {
+                kind: {f"recall@{k}": round(s["hits"] / s["count"], 4), "mrr": round(s["rr"] / s["count"], 4)}
+                for kind, s in sorted(per_kind.items())
+            },
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "embeddings_skipped": skipped,
+        })
+        r = results[-1]
+        kinds = "  ".join(f"{kind}={s[f'recall@{k}']}" for kind, s in r["by_kind"].items())
+        print(f"{name:<16} recall@{k}={r[f'recall@{k}']:<7} mrr={r['mrr']:<7} p50={r['p50_ms']:>7} ms  "
+              f"p95={r['p95_ms']:>7} ms  skipped={skipped:<5} {kinds}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dims", type=int, default=256, help="dimensions of the hashed embeddings")
+    parser.add_argument("--openai", action="store_true", help="embed with EMBEDDING_MODEL instead of hashed vectors")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_retrieval_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+    app.init_storage()
+    from langchain_community.vectorstores import FAISS
+
+    if not args.openai:
+        app.embedding_model = hashed_embeddings(args.dims)
+    app.RETRIEVAL_K = args.k
+
+    chunks = synthetic_manual(args.chunks)
+    queries = synthetic_queries(chunks, min(args.queries, len(chunks)))
+    texts = [text for text, _ in chunks]
+    metadatas = [{"file_name": "manual.pdf", "page_start": i // 4 + 1, "page_end": i // 4 + 1, "target": i}
+                 for i in range(len(chunks))]
+    ids = [str(uuid.uuid4()) for _ in chunks]
+
+    start = time.perf_counter()
+    vectorstore = FAISS.from_texts(texts, app.get_embedding_model(), metadatas=metadatas, ids=ids)
+    session_id = f"bench-{uuid.uuid4().hex}"
+    app.save_vectorstore(vectorstore, session_id)
+    app.build_lexical_index(session_id, vectorstore)
+    print(f"{len(chunks)} chunks indexed in {time.perf_counter() - start:.1f}s, {len(queries)} queries")
+
+    results = asyncio.run(run_scenarios(app, vectorstore, session_id, queries, args.k))
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Startup benchmark and import-time budget check.
+Measures, each time in a fresh Python process and working directory:
+- import: the wall time of `import app` (median of several runs), and the slowest modules it pulls in
+  according to `python -X importtime`
+- server (optional): the time from launching uvicorn to /api/v1/health answering (port open) and to
+  /api/v1/ready answering 200 (API clients created and recent notebooks warmed)
+
+Exits with status 1 when the median import time exceeds --budget-ms or when one of the heavy client or
+PDF libraries is imported by `import app` rather than on first use, so it can run as a CI check.
+
+Usage (from the backend directory):
+    python benchmarks/bench_startup.py --budget-ms 2500
+    python benchmarks/bench_startup.py --runs 7 --server --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Libraries app.py must only import on first use (API clients, PDF parsing, the FAISS index format)
+LAZY_MODULES = [
+    "langchain_openai", "openai", "langchain_tavily", "pymupdf4llm", "pymupdf", "faiss", "langchain_community"
+]
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "fake")
+    env.setdefault("TAVILY_API_KEY", "fake")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND_DIR), env.get("PYTHONPATH")]))
+    env["PYTHONWARNINGS"] = "ignore"
+    return env
+
+
+def time_import() -> dict:
+    # app.py keeps its data directory relative to the working directory
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=tempfile.mkdtemp(prefix="bench_startup_"),
+        env=child_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int):
+    """Top-level-ish modules by cumulative import time, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=tempfile.mkdtemp(prefix="bench_startup_"),
+        env=child_env(), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # Depth 0 and 1 (the modules app.py and its direct imports pull in) keep the list readable
+        if match and len(match.group(2)) <= 3:
+            modules.append((int(match.group(1)), match.group(3)))
+    modules.sort(reverse=True)
+    return [{"module": name, "ms": round(us / 1000, 1)} for us, name in modules[:top]]
+
+
+def wait_for(url: str, deadline: float, status: int = 200) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == status:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not answer {status} in time")
+
+
+def time_server(port: int, timeout: float) -> dict:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--app-dir", str(BACKEND_DIR), "app:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=tempfile.mkdtemp(prefix="bench_startup_"), env=child_env(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    start = time.perf_counter()
+    try:
+        base = f"http://127.0.0.1:{port}/api/v1"
+        healthy = wait_for(f"{base}/health", start + timeout)
+        ready = wait_for(f"{base}/ready", start + timeout)
+        with urllib.request.urlopen(f"{base}/ready") as response:
+            state = json.loads(response.read())
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "health_seconds": round(healthy - start, 3),
+        "ready_seconds": round(ready - start, 3),
+        "clients_seconds": state.get("clients_seconds"),
+        "notebooks_warmed": state.get("notebooks_warmed"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh-process imports to take the median of")
+    parser.add_argument("--budget-ms", type=float, default=2500, help="fail when the median import takes longer")
+    parser.add_argument("--top", type=int, default=10, help="slowest imported modules to report")
+    parser.add_argument("--server", action="store_true", help="also time uvicorn until health and readiness")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    runs = [time_import() for _ in range(args.runs)]
+    median_ms = round(statistics.median(run["seconds"] for run in runs) * 1000, 1)
+    loaded = sorted({module for run in runs for module in run["loaded"]})
+    results = {
+        "args": vars(args),
+        "import": {
+            "median_ms": median_ms,
+            "runs_ms": [round(run["seconds"] * 1000, 1) for run in runs],
+            "eagerly_loaded": loaded,
+            "slowest_modules": slowest_imports(args.top),
+        },
+    }
+    print(f"import app: median {median_ms} ms over {args.runs} runs (budget {args.budget_ms} ms)")
+    for entry in results["import"]["slowest_modules"]:
+        print(f"  {entry['ms']:>8} ms  {entry['module']}")
+
+    if args.server:
+        results["server"] = time_server(args.port, args.timeout)
+        server = results["server"]
+        print(f"server: health after {server['health_seconds']}s, ready after {server['ready_seconds']}s "
+              f"(clients {server['clients_seconds']}s, {server['notebooks_warmed']} notebooks warmed)")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"median import time {median_ms} ms exceeds the {args.budget_ms} ms budget")
+    if loaded:
+        failures.append(f"imported at startup instead of on first use: {', '.join(loaded)}")
+    results["failures"] = failures
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Multi-worker serving benchmark: memory and query throughput as uvicorn worker processes are added.
+Seeds a data directory with synthetic notebooks, then for each serving mode and worker count starts
+`uvicorn --workers N` (WEB_CONCURRENCY=N) with local fakes for OpenAI and Tavily, waits until every
+worker has warmed all notebooks into its index cache, runs concurrent queries against random notebooks,
+and measures the server's process tree:
+- faiss:        FAISS indexes loaded into each worker (SHARED_INDEXES=false)
+- faiss-shared: FAISS vector codes memory-mapped read-only and shared via the page cache (SHARED_INDEXES=true)
+- mmap:         the same notebooks in the memory-mapped index format (INDEX_FORMAT=mmap)
+
+Memory is reported as RSS (counts shared pages once per process) and PSS (splits shared pages between the
+processes mapping them), summed over the supervisor and its workers; PSS is the honest total. Linux only.
+Queries run with dense retrieval and the answer cache off, and the fakes answer instantly by default, so
+throughput reflects the app's own CPU work and grows with workers only up to the available cores.
+
+Usage (from the backend directory):
+    python benchmarks/bench_workers.py --workers 1 2 4 --notebooks 8 --chunks 4000 --dims 1536
+    python benchmarks/bench_workers.py --modes faiss faiss-shared --workers 1 4 --output workers.json
+"""
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+from bench_app import ACTIONS, COMPONENTS, SYMPTOMS, make_fakes  # noqa: E402
+
+MODES = ("faiss", "faiss-shared", "mmap")
+
+
+def create_app():
+    """uvicorn --factory entry point run in each worker: the app with the benchmark's fakes installed"""
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+
+    embeddings, chat_model_class, tavily = make_fakes(
+        int(os.environ["BENCH_DIMS"]), 0.0, float(os.environ["BENCH_LLM_LATENCY_MS"]) / 1000,
+        0.0, float(os.environ["BENCH_WEB_LATENCY_MS"]) / 1000
+    )
+    app.embedding_model = embeddings
+    app.llm = chat_model_class(callbacks=[app.LlmUsageRecorder()])
+    app.tavily_search = tavily
+    return app.app
+
+
+@functools.lru_cache(maxsize=None)
+def word_bucket(word: str, dims: int) -> int:
+    # Same hashing as the fake embeddings of bench_app, so questions retrieve the chunks they came from
+    return int(hashlib.md5(word.encode()).hexdigest(), 16) % dims
+
+
+def hashed_vectors(texts, dims: int) -> np.ndarray:
+    vectors = np.zeros((len(texts), dims), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, word_bucket(word, dims)] += 1.0
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+def synthetic_chunks(notebook: int, count: int, rng: random.Random):
+    """(chunk text, question about it) pairs"""
+    chunks = []
+    for i in range(count):
+        component, symptom, action = rng.choice(COMPONENTS), rng.choice(SYMPTOMS), rng.choice(ACTIONS)
+        words = [rng.choice(COMPONENTS + SYMPTOMS + ACTIONS) for _ in range(120)]
+        text = f"Unit N{notebook}X{i}: when the {component} shows {symptom}, {action} the {component}. " + " ".join(words)
+        chunks.append((text, f"What should I do when the {component} of unit N{notebook}X{i} shows {symptom}?"))
+    return chunks
+
+
+def seed(app, data_root: Path, notebooks: int, chunks: int, dims: int):
+    """Write the notebooks in the FAISS format under data_root/faiss and the mmap format under data_root/mmap"""
+    from langchain_core.documents import Document
+
+    faiss_dir, mmap_dir = data_root / "faiss", data_root / "mmap"
+    faiss_dir.mkdir(parents=True)
+    # app.py keeps its data directory relative to the working directory
+    os.chdir(faiss_dir)
+    app.init_storage()
+    rng = random.Random(7)
+    questions = {}
+    for n in range(notebooks):
+        session_id = str(uuid.uuid4())
+        pairs = synthetic_chunks(n, chunks, rng)
+        texts = [text for text, _ in pairs]
+        vectors = hashed_vectors(texts, dims)
+        metadatas = [{"file_name": f"manual-{n}.pdf", "page_start": i // 4 + 1, "page_end": i // 4 + 1}
+                     for i in range(chunks)]
+        store = app.new_faiss_store(app.build_faiss_index(vectors))
+        store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        app.save_vectorstore(store, session_id)
+        app.insert_notebook(session_id, f"Notebook {n}")
+        questions[session_id] = [question for _, question in rng.sample(pairs, min(50, chunks))]
+
+    shutil.copytree(faiss_dir, mmap_dir)
+    for session_id in questions:
+        index_path = mmap_dir / "data" / "index" / session_id
+        store = app.load_vectorstore(session_id)
+        documents = [
+            Document(id=doc_id, page_content=store.docstore.search(doc_id).page_content,
+                     metadata=store.docstore.search(doc_id).metadata)
+            for _, doc_id in sorted(store.index_to_docstore_id.items())
+        ]
+        for name in app.FAISS_INDEX_FILES:
+            (index_path / name).unlink()
+        app.write_mmap_index(index_path, documents, [store.index.reconstruct_n(0, store.index.ntotal)], dims)
+    return questions
+
+
+def process_tree(root: int):
+    """PIDs of root and all its descendants, from /proc"""
+    parents = {}
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            try:
+                # The command name may contain spaces; ppid is the second field after it
+                stat = (entry / "stat").read_text()
+                parents[int(entry.name)] = int(stat.rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+    tree, frontier = [root], [root]
+    while frontier:
+        children = [pid for pid, ppid in parents.items() if ppid in frontier]
+        tree += children
+        frontier = children
+    return tree
+
+
+def memory_mb(pids):
+    """Summed RSS and PSS (MB) of the processes, plus PSS per process"""
+    rss = pss = 0
+    per_process = {}
+    for pid in pids:
+        try:
+            fields = {
+                line.split(":")[0]: int(line.split()[1])
+                for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]
+            }
+        except (OSError, ValueError):
+            continue
+        rss += fields["Rss"]
+        pss += fields["Pss"]
+        per_process[pid] = round(fields["Pss"] / 1024, 1)
+    return round(rss / 1024, 1), round(pss / 1024, 1), per_process
+
+
+async def wait_until_warm(base_url: str, workers: int, notebooks: int, timeout: float):
+    """Poll /api/v1/stats on fresh connections until every worker holds all notebooks in its index cache"""
+    import httpx
+
+    warm = set()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+                stats = (await client.get("/api/v1/stats")).json()
+            if stats["index_cache"]["entries"] >= notebooks:
+                warm.add(stats["worker"]["pid"])
+            if len(warm) >= workers:
+                return
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"only {len(warm)} of {workers} workers warmed up")
+
+
+async def run_queries(base_url: str, questions, count: int, concurrency: int):
+    import httpx
+
+    rng = random.Random(11)
+    session_ids = list(questions)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client):
+        nonlocal errors
+        session_id = rng.choice(session_ids)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/v1/query", json={
+                "session_id": session_id, "question": rng.choice(questions[session_id]), "cache": False
+            })
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(count)))
+        elapsed = time.perf_counter() - start
+    return {
+        "errors": errors,
+        "queries_per_second": round(count / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+def bench(mode: str, workers: int, data_root: Path, questions, args):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "fake",
+        "TAVILY_API_KEY": "fake",
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(BACKEND_DIR), env.get("PYTHONPATH")])),
+        "PYTHONWARNINGS": "ignore",
+        "WEB_CONCURRENCY": str(workers),
+        "SHARED_INDEXES": "true" if mode == "faiss-shared" else "false",
+        "WARMUP_NOTEBOOKS": str(len(questions)),
+        "RETRIEVAL_MODE": "dense",
+        "ANSWER_CACHE_ENABLED": "false",
+        "BENCH_DIMS": str(args.dims),
+        "BENCH_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "BENCH_WEB_LATENCY_MS": str(args.web_latency_ms),
+    })
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_workers:create_app", "--factory", "--app-dir", str(BENCHMARKS_DIR),
+         "--workers", str(workers), "--port", str(args.port), "--log-level", "warning"],
+        cwd=data_root / ("mmap" if mode == "mmap" else "faiss"), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        start = time.perf_counter()
+        asyncio.run(wait_until_warm(base_url, workers, len(questions), args.timeout))
+        warm_seconds = time.perf_counter() - start
+        queries = asyncio.run(run_queries(base_url, questions, args.queries, args.concurrency))
+        rss, pss, per_process = memory_mb(process_tree(process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "warm_seconds": round(warm_seconds, 2),
+        **queries,
+        "rss_mb": rss,
+        "pss_mb": pss,
+        "pss_per_process_mb": per_process,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--notebooks", type=int, default=8, help="hot notebooks every worker serves")
+    parser.add_argument("--chunks", type=int, default=4000, help="chunks per notebook")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--web-latency-ms", type=float, default=0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the workers to warm up")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve() if args.output else None
+    data_root = Path(tempfile.mkdtemp(prefix="bench_workers_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import app
+
+    start = time.perf_counter()
+    questions = seed(app, data_root, args.notebooks, args.chunks, args.dims)
+    vector_mb = args.notebooks * args.chunks * args.dims * 4 / 2 ** 20
+    print(f"{args.notebooks} notebooks x {args.chunks} chunks seeded in {time.perf_counter() - start:.1f}s "
+          f"({vector_mb:.0f} MB of vectors); {os.cpu_count()} CPUs")
+
+    results = []
+    for mode in args.modes:
+        for workers in args.workers:
+            r = bench(mode, workers, data_root, questions, args)
+            results.append(r)
+            print(f"{mode:<13} workers={workers:<2} {r['queries_per_second']:>7} q/s  p50={r['p50_ms']:>7} ms  "
+                  f"p99={r['p99_ms']:>7} ms  RSS={r['rss_mb']:>7} MB  PSS={r['pss_mb']:>7} MB  errors={r['errors']}")
+
+    shutil.rmtree(data_root, ignore_errors=True)
+    if output:
+        output.write_text(json.dumps({"args": vars(args), "vector_mb": round(vector_mb, 1), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Fake OpenAI embeddings server for offline ingestion benchmarks.
+Implements POST /v1/embeddings with configurable latency, dimensions and a requests-per-minute
+limit that answers 429 like the real API, so the embedding scheduler can be exercised locally.
+
+Usage:
+    python benchmarks/fake_embedding_server.py --port 9100 --latency-ms 200 --rpm 500
+    EMBEDDING_BASE_URL=http://127.0.0.1:9100/v1 python app.py
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import time
+from collections import deque
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def fake_vector(text: str, dims: int) -> np.ndarray:
+    """Deterministic unit vector derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(latency_ms: float = 100, dims: int = 3072, rpm: int = 0) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI Embeddings")
+    app.state.requests = 0
+    app.state.rejected = 0
+    recent = deque()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        # Sliding one-minute window, like a per-key RPM limit
+        now = time.monotonic()
+        while recent and now - recent[0] > 60:
+            recent.popleft()
+        if rpm and len(recent) >= rpm:
+            app.state.rejected += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"retry-after": "1"}
+            )
+        recent.append(now)
+        app.state.requests += 1
+
+        await asyncio.sleep(latency_ms / 1000)
+
+        out_dims = body.get("dimensions") or dims
+        data = []
+        for i, item in enumerate(inputs):
+            # Token-id inputs (tiktoken pre-tokenized) are hashed by their repr
+            vector = fake_vector(item if isinstance(item, str) else repr(item), out_dims)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        tokens = sum(len(item) // 4 + 1 if isinstance(item, str) else len(item) for item in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--dims", type=int, default=3072)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = unlimited)")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.dims, args.rpm), host=args.host, port=args.port)